@@ -1,53 +1,88 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from typing import List, Optional
+import contextlib
+import logging
+import orjson
 import traceback
 
-from src.ocr import load_document_images
-from src.lineitem_extractor import extract_pagewise_line_items
-from src.reconciler import reconcile_totals
+from src.config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_DB_PATH, LOG_LEVEL
+from src.fetch import DocumentTooLargeError, close_http_client
+from src.jobs import JobStore, JobScheduler, QueueFullError
+from src.pipeline import extract_bill_cached, iter_bill, shutdown_executor
+from src.records import bill_to_dict, page_to_dict
 from src.utils import token_usage_stub
 
-app = FastAPI(title="Bill Extraction API")
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("bill_extractor")
+
+scheduler = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global scheduler
+    scheduler = JobScheduler(JobStore(JOB_DB_PATH), workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE)
+    await scheduler.start()
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        scheduler.store.close()
+        await close_http_client()
+        shutdown_executor()
+
+
+app = FastAPI(title="Bill Extraction API", lifespan=lifespan)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return orjson.dumps(content)
+
 
 class ExtractRequest(BaseModel):
     document: str
+    # response projection: raw OCR lines are opt-in, fields limits each bill item's keys
+    include_lines: bool = False
+    fields: Optional[List[str]] = None
 
+    def projection(self):
+        return {"include_lines": self.include_lines, "item_fields": self.fields}
 
-@app.post("/extract-bill-data")
-async def extract_bill_data(req: ExtractRequest):
-    try:
-        # Load all pages as images
-        pages = load_document_images(req.document)
 
-        pagewise_results = []
-        total_items = 0
+class JobDocument(ExtractRequest):
+    priority: int = 0
+
 
-        # Extract line items from each page
-        for index, img in enumerate(pages, start=1):
-            page_result = extract_pagewise_line_items(img, str(index))
-            pagewise_results.append(page_result)
-            total_items += len(page_result["bill_items"])
+class JobsRequest(BaseModel):
+    documents: List[JobDocument]
 
-        # Reconcile totals from all pages
-        totals = reconcile_totals(pagewise_results)
 
-        return {
+@app.post("/extract-bill-data")
+async def extract_bill_data(req: ExtractRequest):
+    try:
+        # Rasterize pages one window at a time, extract them in parallel on the
+        # shared process pool as they arrive, then reconcile totals. Identical
+        # documents are served from (or coalesced onto) the result cache.
+        data, cache_status = await extract_bill_cached(req.document, include_lines=req.include_lines)
+
+        return FastJSONResponse({
             "is_success": True,
             "token_usage": token_usage_stub(),
-            "data": {
-                "pagewise_line_items": pagewise_results,
-                "total_item_count": total_items,
-                **totals
-            }
-        }
+            "data": bill_to_dict(data, **req.projection())
+        }, headers={"X-Cache": cache_status})
+
+    except DocumentTooLargeError as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
 
     except Exception as e:
-        # Print full traceback to console
         tb = traceback.format_exc()
-        print("\n===== INTERNAL SERVER ERROR TRACEBACK =====")
-        print(tb)
-        print("===========================================\n")
+        logger.exception("extraction failed for %s", req.document)
 
         # Return full traceback in response (for debugging)
         return JSONResponse(
@@ -57,3 +92,53 @@ async def extract_bill_data(req: ExtractRequest):
                 "trace": tb
             }
         )
+
+
+@app.post("/extract-bill-data/stream")
+async def extract_bill_data_stream(req: ExtractRequest):
+    """
+    NDJSON stream: one {"type": "page"} record per page as soon as it is
+    extracted (completion order) with the running totals so far, then a final
+    {"type": "summary"} record with the item count and reconciled totals.
+    """
+    projection = req.projection()
+
+    async def records():
+        try:
+            async for page, data in iter_bill(req.document, include_lines=req.include_lines):
+                if page is None:
+                    summary = {k: v for k, v in data.items() if k != "pagewise_line_items"}
+                    record = {"type": "summary", "is_success": True, "token_usage": token_usage_stub(), **summary}
+                else:
+                    record = {"type": "page", "page": page_to_dict(page, **projection), "running_totals": data}
+                yield orjson.dumps(record) + b"\n"
+        except Exception as e:
+            logger.exception("streaming extraction failed for %s", req.document)
+            yield orjson.dumps({"type": "error", "is_success": False, "error": str(e)}) + b"\n"
+
+    return StreamingResponse(records(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs", status_code=202)
+async def submit_jobs(req: JobsRequest):
+    try:
+        job_ids = await scheduler.submit_many([(d.document, d.priority, d.projection()) for d in req.documents])
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_ids": job_ids}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = scheduler.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Per-stage timing histograms and pipeline counters in Prometheus text format.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,59 @@
+# batch_extract.py
+"""
+Offline batch extraction over a directory, glob or JSONL manifest.
+
+Documents are spread over a process pool (one whole document per worker),
+results are appended to JSONL (or Parquet part files) as they finish, and
+finished ids go to a checkpoint file so a killed run resumes where it stopped.
+
+    python batch_extract.py sample_docs/ --output results.jsonl
+    python batch_extract.py "archive/**/*.pdf" --output results.jsonl --workers 16
+    python batch_extract.py manifest.jsonl --output results_parquet --format parquet
+
+Manifest lines look like API requests: {"document": "<path or URL>", "id": "optional"}.
+Re-running the same command skips every id already in <output>.checkpoint.
+"""
+import argparse
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch bill extraction with checkpoint/resume")
+    parser.add_argument("inputs", nargs="+", help="directories, glob patterns, JSONL manifests or documents")
+    parser.add_argument("--output", required=True, help="JSONL file, or a directory of part files for parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default=None,
+                        help="default: parquet if --output ends with .parquet or _parquet, else jsonl")
+    parser.add_argument("--checkpoint", help="finished-id file (default: <output>.checkpoint)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--flush-every", type=int, default=None,
+                        help="records per write (default: 1 for jsonl, 500 for parquet)")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between throughput reports")
+    parser.add_argument("--include-lines", action="store_true", help="keep raw OCR lines in each page")
+    parser.add_argument("--fields", help="comma-separated bill item keys to keep")
+    args = parser.parse_args(argv)
+
+    # imported late so --help works without the OCR stack installed
+    from src.batch import run_batch
+
+    fmt = args.format or ("parquet" if args.output.rstrip("/").endswith(("parquet", ".parquet")) else "jsonl")
+    flush_every = args.flush_every or (500 if fmt == "parquet" else 1)
+    projection = {
+        "include_lines": args.include_lines,
+        "item_fields": args.fields.split(",") if args.fields else None,
+    }
+    try:
+        stats = run_batch(
+            args.inputs, args.output, checkpoint=args.checkpoint, fmt=fmt, workers=args.workers,
+            projection=projection, flush_every=flush_every, report_every=args.report_every,
+            report=lambda msg: print(msg, file=sys.stderr, flush=True),
+        )
+    except KeyboardInterrupt:
+        # aborted by a second Ctrl-C; finished records are already checkpointed
+        return 130
+    if stats["interrupted"]:
+        return 130
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# benchmark.py
+"""
+Benchmark the extraction pipeline stage by stage.
+
+Runs every document in sample_docs/ plus a set of generated invoice images and
+times rasterize / ocr / line grouping / item extraction / reconcile separately.
+Reports p50/p95 latency per stage, pages/sec and peak RSS as JSON.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --write-baseline benchmarks/baseline.json
+    python benchmark.py --baseline benchmarks/baseline.json --threshold 0.2
+
+With --baseline the run exits non-zero when any stage p50/p95 regresses past
+the threshold (fractional slowdown) compared to the baseline file. Timings are
+machine-specific, so no baseline is checked in: record one with
+--write-baseline on the machine that runs the comparison.
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+from pathlib import Path
+import statistics
+import sys
+import time
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_docs")
+STAGES = ["rasterize", "ocr", "line_grouping", "item_extraction", "reconcile"]
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return {"self": round(own, 1), "children": round(children, 1)}
+
+
+def make_synthetic_invoice(n_items=25, seed=0, size=(2480, 3508)):
+    """
+    Draw an A4 @ 300 DPI invoice-like page: header, item table, totals footer.
+    """
+    import random
+    from PIL import Image, ImageDraw, ImageFont
+
+    rnd = random.Random(seed)
+    try:
+        font = ImageFont.load_default(size=42)
+    except TypeError:
+        font = ImageFont.load_default()
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((150, 120), "CITY CARE PHARMACY", fill="black", font=font)
+    draw.text((150, 190), f"Invoice No: INV-{seed:05d}", fill="black", font=font)
+    draw.text((150, 400), "Description", fill="black", font=font)
+    draw.text((1300, 400), "Qty", fill="black", font=font)
+    draw.text((1600, 400), "Rate", fill="black", font=font)
+    draw.text((2000, 400), "Amount", fill="black", font=font)
+    draw.line((150, 460, 2330, 460), fill="black", width=3)
+
+    words = ["Paracetamol", "Tablet", "Syrup", "Capsule", "Injection", "Bandage", "Cream", "Drops", "Strip"]
+    y = 500
+    total = 0.0
+    for _ in range(n_items):
+        name = " ".join(rnd.choice(words) for _ in range(2))
+        qty = rnd.randint(1, 10)
+        rate = round(rnd.uniform(5, 500), 2)
+        amount = round(qty * rate, 2)
+        total += amount
+        draw.text((150, y), name, fill="black", font=font)
+        draw.text((1300, y), str(qty), fill="black", font=font)
+        draw.text((1600, y), f"{rate:.2f}", fill="black", font=font)
+        draw.text((2000, y), f"{amount:.2f}", fill="black", font=font)
+        y += 100
+    draw.line((150, y, 2330, y), fill="black", width=3)
+    draw.text((1600, y + 40), f"Grand Total {total:.2f}", fill="black", font=font)
+    return img
+
+
+def _documents(include_samples, synthetic):
+    docs = []
+    if include_samples:
+        for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.pdf"))):
+            docs.append({"name": os.path.basename(path), "path": path})
+    for i in range(synthetic):
+        docs.append({"name": f"synthetic-{i}", "image": make_synthetic_invoice(n_items=20 + 5 * i, seed=i)})
+    return docs
+
+
+def run_benchmark(include_samples=True, synthetic=3, repeat=3):
+    from src.ocr import load_document_images, run_ocr_on_image
+    from src.table_detector import extract_rows_from_ocr
+    from src.lineitem_extractor import (
+        conservative_extract_from_lines_with_split_support,
+        filter_header_footer_lines,
+        _estimate_amount_column,
+    )
+    from src.reconciler import reconcile_totals
+
+    timings = {stage: [] for stage in STAGES}
+    total_pages = 0
+    total_seconds = 0.0
+    docs = _documents(include_samples, synthetic)
+
+    for _ in range(repeat):
+        for doc in docs:
+            doc_start = time.perf_counter()
+            if "path" in doc:
+                t0 = time.perf_counter()
+                pages = load_document_images(doc["path"])
+                timings["rasterize"].append(time.perf_counter() - t0)
+            else:
+                pages = [doc["image"]]
+
+            page_results = []
+            for index, img in enumerate(pages, start=1):
+                t0 = time.perf_counter()
+                ocr = run_ocr_on_image(img)
+                timings["ocr"].append(time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                ocr_lines = extract_rows_from_ocr(ocr, min_confidence=10)
+                timings["line_grouping"].append(time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                lines = filter_header_footer_lines(ocr_lines)
+                items = conservative_extract_from_lines_with_split_support(lines, _estimate_amount_column(lines))
+                timings["item_extraction"].append(time.perf_counter() - t0)
+
+                page_results.append({"page_no": str(index), "bill_items": items, "ocr_lines": ocr_lines})
+
+            t0 = time.perf_counter()
+            reconcile_totals(page_results)
+            timings["reconcile"].append(time.perf_counter() - t0)
+
+            total_pages += len(pages)
+            total_seconds += time.perf_counter() - doc_start
+
+    stages = {}
+    for stage, values in timings.items():
+        stages[stage] = {
+            "count": len(values),
+            "p50_ms": round(_percentile(values, 50) * 1000, 3) if values else None,
+            "p95_ms": round(_percentile(values, 95) * 1000, 3) if values else None,
+            "mean_ms": round(statistics.mean(values) * 1000, 3) if values else None,
+        }
+    return {
+        "documents": len(docs),
+        "repeat": repeat,
+        "pages": total_pages,
+        "pages_per_sec": round(total_pages / total_seconds, 3) if total_seconds else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": stages,
+    }
+
+
+def compare_to_baseline(report, baseline, threshold):
+    """
+    Return a list of human-readable regressions (empty when within threshold).
+    """
+    regressions = []
+    for stage, base in baseline.get("stages", {}).items():
+        cur = report["stages"].get(stage)
+        if not cur:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            b, c = base.get(metric), cur.get(metric)
+            if b and c and c > b * (1 + threshold):
+                regressions.append(f"{stage}.{metric}: {c:.1f}ms vs baseline {b:.1f}ms (+{(c / b - 1) * 100:.0f}%)")
+    base_pps = baseline.get("pages_per_sec")
+    cur_pps = report.get("pages_per_sec")
+    if base_pps and cur_pps and cur_pps < base_pps / (1 + threshold):
+        regressions.append(f"pages_per_sec: {cur_pps:.2f} vs baseline {base_pps:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bill extraction pipeline")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, default=3, help="number of generated invoice pages")
+    parser.add_argument("--no-samples", action="store_true", help="skip sample_docs/*.pdf")
+    parser.add_argument("--ocr-cache", action="store_true", help="keep the OCR result cache enabled")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed fractional slowdown")
+    parser.add_argument("--write-baseline", help="write this run as the new baseline")
+    args = parser.parse_args(argv)
+    if args.baseline and not os.path.exists(args.baseline):
+        parser.error(f"baseline {args.baseline} not found; record one first with --write-baseline")
+
+    if not args.ocr_cache:
+        # config is read at import time, so this must happen before importing src
+        os.environ["OCR_CACHE_ENABLED"] = "0"
+
+    report = run_benchmark(include_samples=not args.no_samples, synthetic=args.synthetic, repeat=args.repeat)
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in (args.output, args.write_baseline):
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            Path(path).write_text(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.threshold)
+        if regressions:
+            print("\nPERFORMANCE REGRESSION:", file=sys.stderr)
+            for r in regressions:
+                print("  " + r, file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 # run_all_samples.py
 import traceback
-from src.ocr import load_document_images
+from src.ocr import load_document_images, run_ocr_on_images
 from src.lineitem_extractor import extract_pagewise_line_items
 from src.reconciler import reconcile_totals
 
@@ -22,17 +22,20 @@ for doc in documents:
 
         page_items = []
 
-        # 2) Extract line items page-wise
-        for i, img in enumerate(pages, start=1):
+        # 2) OCR the whole document in one batched Tesseract call
+        ocr_pages = run_ocr_on_images(pages, dpi=300)
+
+        # 3) Extract line items page-wise
+        for i, (img, ocr) in enumerate(zip(pages, ocr_pages), start=1):
             try:
-                result = extract_pagewise_line_items(img, page_no=str(i))
+                result = extract_pagewise_line_items(img, page_no=str(i), ocr=ocr)
                 print(f" Page {i}: {len(result['bill_items'])} items extracted")
                 page_items.append(result)
             except Exception as e:
                 print(f" ❌ ERROR extracting page {i}")
                 traceback.print_exc()
 
-        # 3) Reconcile totals
+        # 4) Reconcile totals
         try:
             totals = reconcile_totals(page_items)
             print("\nFinal reconciled amount:", totals["reconciled_amount"])
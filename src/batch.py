@@ -0,0 +1,355 @@
+# src/batch.py
+"""
+Offline batch extraction for large document sets (see batch_extract.py).
+Each pool worker extracts whole documents, so pages never cross process
+boundaries. Results are appended to JSONL or Parquet as documents finish, and
+a checkpoint file of finished ids lets a killed run resume where it stopped.
+"""
+import glob
+import json
+import os
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import orjson
+
+from src.ocr import is_remote_document, normalize_document_path, resolve_document_path
+from src.pipeline import build_bill_data, extract_document_sync
+from src.records import bill_to_dict
+
+DOCUMENT_SUFFIXES = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+
+
+class ManifestLineError(Exception):
+    pass
+
+
+def iter_inputs(sources):
+    """
+    Yield (doc_id, document) from directories (searched recursively), glob
+    patterns, JSONL manifests ({"document": ..., "id": optional} per line) or
+    plain paths/URLs. doc_id defaults to the document string. A malformed
+    manifest line yields ("<manifest>:<line number>", ManifestLineError) so the
+    run can record it and go on.
+    """
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(DOCUMENT_SUFFIXES):
+                        path = os.path.join(root, name)
+                        yield path, path
+        elif source.lower().endswith(".jsonl") and os.path.isfile(source):
+            with open(source, encoding="utf-8") as f:
+                for lineno, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                        document = record.get("document")
+                    except (ValueError, AttributeError) as e:
+                        yield f"{source}:{lineno}", ManifestLineError(f"malformed manifest line: {e}")
+                        continue
+                    if document:
+                        yield str(record.get("id") or document), document
+        elif glob.has_magic(source):
+            for path in sorted(glob.iglob(source, recursive=True)):
+                if os.path.isfile(path):
+                    yield path, path
+        else:
+            yield source, source
+
+
+def extract_bill_sync(document, conservative_min_conf=40, include_lines=False):
+    """
+    Blocking whole-document extraction in the current process, with the same
+    page plan as the API (text layer, adaptive DPI, ROI OCR, OCR_BATCH_PAGES).
+    Returns (extract_bill() data, page count).
+    """
+    downloaded = is_remote_document(normalize_document_path(document))
+    path = resolve_document_path(document)
+    try:
+        results = extract_document_sync(path, conservative_min_conf, include_lines=include_lines)
+        return build_bill_data(results), len(results)
+    finally:
+        if downloaded:
+            os.remove(path)
+
+
+def _init_worker():
+    # Ctrl-C reaches the whole process group; only the parent decides what stops.
+    # SIGTERM gets its default back from the parent's stop handler so that an
+    # aborting run can terminate its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def run_document(doc_id, document, projection, conservative_min_conf=40):
+    """
+    Pool job: one output record per document. Failures are recorded, not raised.
+    """
+    t0 = time.perf_counter()
+    record = {"id": doc_id, "document": document}
+    pages = 0
+    try:
+        data, pages = extract_bill_sync(document, conservative_min_conf,
+                                        include_lines=projection.get("include_lines", False))
+        record.update(is_success=True, data=bill_to_dict(data, **projection))
+    except Exception as e:
+        record.update(is_success=False, error=f"{type(e).__name__}: {e}")
+    record["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return record, pages
+
+
+def _terminate_pool(pool):
+    # workers ignore SIGINT, and the executor's exit hook would wait for their
+    # running documents
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for proc in processes:
+        proc.terminate()
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def append_checkpoint(path, ids):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(doc_id + "\n" for doc_id in ids))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class JsonlWriter:
+    """
+    Appends one JSON line per record and flushes it before it is checkpointed.
+    """
+    def __init__(self, path):
+        self._path = path
+        self._repair_tail(path)
+        self._f = open(path, "ab")
+
+    def unrecorded_ids(self, finished, block=64 * 1024):
+        """
+        Ids of the records after the last one in `finished`: a run killed between
+        writing a group and checkpointing it. Only that tail is read, backwards.
+        """
+        ids = []
+        with open(self._path, "rb") as f:
+            pos = f.seek(0, os.SEEK_END)
+            head = b""
+            while pos > 0:
+                start = max(0, pos - block)
+                f.seek(start)
+                lines = (f.read(pos - start) + head).split(b"\n")
+                pos = start
+                # the first piece may be the end of a line that starts further back
+                head = lines.pop(0) if pos > 0 else b""
+                for line in reversed(lines):
+                    if not line.strip():
+                        continue
+                    doc_id = orjson.loads(line)["id"]
+                    if doc_id in finished:
+                        return ids
+                    ids.append(doc_id)
+        return ids
+
+    @staticmethod
+    def _repair_tail(path, block=64 * 1024):
+        # drop a half-written last line left by a killed run (it was never
+        # checkpointed); only the tail of the file is read, backwards
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            pos = end
+            while pos > 0:
+                start = max(0, pos - block)
+                f.seek(start)
+                cut = f.read(pos - start).rfind(b"\n")
+                if cut >= 0:
+                    f.truncate(start + cut + 1)
+                    return
+                pos = start
+            f.truncate(0)
+
+    def write(self, records):
+        for record in records:
+            self._f.write(orjson.dumps(record) + b"\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+
+class ParquetWriter:
+    """
+    Writes each flushed group of records as a new part file under `path`
+    (a directory), so finished parts stay valid if the run is killed.
+    Needs pyarrow. The extraction payload is stored as a JSON string column.
+    """
+    def __init__(self, path):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._dir = path
+        # explicit schema so all-null columns in one part don't conflict with other parts
+        self._schema = pyarrow.schema([
+            ("id", pyarrow.string()), ("document", pyarrow.string()), ("is_success", pyarrow.bool_()),
+            ("error", pyarrow.string()), ("elapsed_s", pyarrow.float64()),
+            ("total_item_count", pyarrow.int64()), ("reconciled_amount", pyarrow.float64()),
+            ("printed_total", pyarrow.float64()), ("data", pyarrow.string()),
+        ])
+        os.makedirs(path, exist_ok=True)
+        self._part = len(glob.glob(os.path.join(path, "part-*.parquet")))
+
+    def unrecorded_ids(self, finished):
+        # parts are checkpointed one at a time: only the newest can be missing
+        if self._part == 0:
+            return []
+        last = os.path.join(self._dir, f"part-{self._part - 1:05d}.parquet")
+        ids = self._pq.read_table(last, columns=["id"]).column("id").to_pylist()
+        return [doc_id for doc_id in ids if doc_id not in finished]
+
+    def write(self, records):
+        if not records:
+            return
+        rows = {
+            "id": [r["id"] for r in records],
+            "document": [r["document"] for r in records],
+            "is_success": [r["is_success"] for r in records],
+            "error": [r.get("error") for r in records],
+            "elapsed_s": [r["elapsed_s"] for r in records],
+            "total_item_count": [r.get("data", {}).get("total_item_count") for r in records],
+            "reconciled_amount": [r.get("data", {}).get("reconciled_amount") for r in records],
+            "printed_total": [r.get("data", {}).get("printed_total") for r in records],
+            "data": [orjson.dumps(r["data"]).decode() if "data" in r else None for r in records],
+        }
+        final = os.path.join(self._dir, f"part-{self._part:05d}.parquet")
+        tmp = final + ".tmp"
+        self._pq.write_table(self._pa.table(rows, schema=self._schema), tmp)
+        os.replace(tmp, final)
+        self._part += 1
+
+    def close(self):
+        pass
+
+
+def run_batch(sources, output, checkpoint=None, fmt="jsonl", workers=None, projection=None,
+              conservative_min_conf=40, flush_every=1, report_every=10.0, report=print):
+    """
+    Extract every input document not yet in the checkpoint, `workers` documents
+    at a time. Records are written in groups of `flush_every`; their ids are
+    appended to the checkpoint only after the group is on disk.
+    Returns a summary dict.
+    """
+    projection = projection or {}
+    checkpoint = checkpoint or output + ".checkpoint"
+    finished = load_checkpoint(checkpoint)
+    writer = ParquetWriter(output) if fmt == "parquet" else JsonlWriter(output)
+    recovered = writer.unrecorded_ids(finished)
+    if recovered:
+        append_checkpoint(checkpoint, recovered)
+        finished.update(recovered)
+    workers = workers or os.cpu_count() or 1
+
+    stats = {"skipped": 0, "done": 0, "failed": 0, "pages": 0}
+    pending = []
+    start = last_report = time.monotonic()
+
+    def flush():
+        writer.write(pending)
+        append_checkpoint(checkpoint, [r["id"] for r in pending])
+        pending.clear()
+
+    def finish(record, pages):
+        stats["done"] += 1
+        stats["pages"] += pages
+        stats["failed"] += not record["is_success"]
+        pending.append(record)
+
+    def progress(final=False):
+        elapsed = max(time.monotonic() - start, 1e-9)
+        report(f"{'finished' if final else 'progress'}: {stats['done']} docs ({stats['failed']} failed, "
+               f"{stats['skipped']} skipped) in {elapsed:.0f}s | {stats['done'] / elapsed:.2f} docs/s, "
+               f"{stats['pages'] / elapsed:.2f} pages/s")
+
+    # SIGINT/SIGTERM stop new submissions; documents in flight finish and are
+    # checkpointed (a second signal aborts immediately)
+    stop = []
+
+    def request_stop(signum, frame):
+        stop.append(signum)
+        if len(stop) > 1:
+            raise KeyboardInterrupt
+        report("interrupted: finishing documents in flight (Ctrl-C again to abort)")
+
+    handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            handlers[sig] = signal.signal(sig, request_stop)
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    aborted = True
+    try:
+        inflight = set()
+        inputs = iter_inputs(sources)
+        exhausted = False
+        while inflight or not (exhausted or stop):
+            # keep at most 2 documents per worker queued, so huge inputs stay lazy
+            while not (exhausted or stop) and len(inflight) < 2 * workers:
+                item = next(inputs, None)
+                if item is None:
+                    exhausted = True
+                    break
+                doc_id, document = item
+                if doc_id in finished:
+                    stats["skipped"] += 1
+                    continue
+                finished.add(doc_id)
+                if isinstance(document, ManifestLineError):
+                    finish({"id": doc_id, "document": None, "is_success": False,
+                            "error": f"ManifestLineError: {document}", "elapsed_s": 0.0}, 0)
+                    continue
+                inflight.add(pool.submit(run_document, doc_id, document, projection, conservative_min_conf))
+            if not inflight:
+                break
+            completed, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in completed:
+                finish(*fut.result())
+            if len(pending) >= flush_every:
+                flush()
+            if time.monotonic() - last_report >= report_every:
+                last_report = time.monotonic()
+                progress()
+        aborted = False
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+        # on abort, queued and running documents are dropped (they were never
+        # checkpointed) but records that already finished are kept
+        if aborted:
+            _terminate_pool(pool)
+        else:
+            pool.shutdown(wait=True)
+        if pending:
+            flush()
+        writer.close()
+    progress(final=True)
+    stats["elapsed_s"] = round(time.monotonic() - start, 3)
+    stats["interrupted"] = bool(stop)
+    return stats
@@ -3,3 +3,85 @@ import os
 # Read from .env if available
 POPPLER_PATH = r"C:\poppler\poppler-24.02.0\Library\bin" 
 
+# Page pipeline: number of worker processes (0 = one per CPU core) and the
+# maximum number of pages in flight across all requests.
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", "0")) or os.cpu_count() or 1
+MAX_PENDING_PAGES = int(os.getenv("MAX_PENDING_PAGES", str(PAGE_WORKERS * 2)))
+
+# PDF pages rasterized per pdftoppm call when streaming a document
+PDF_PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", "2"))
+
+# How rendered pages reach the pool workers: "pickle" (copied through the pool's
+# pipe) or "shm" (written once to shared memory as grayscale and mapped by the worker)
+PAGE_HANDOFF = os.getenv("PAGE_HANDOFF", "pickle")
+
+# OCR result cache: in-memory LRU (entries) in front of a SQLite file (bytes)
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(".cache", "ocr_cache.sqlite3"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+OCR_CACHE_MEMORY_ITEMS = int(os.getenv("OCR_CACHE_MEMORY_ITEMS", "256"))
+
+# Batch job scheduler (POST /jobs)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(".cache", "jobs.sqlite3"))
+
+# Adaptive DPI: rasterize PDFs at ADAPTIVE_LOW_DPI first and redo a page at
+# ADAPTIVE_HIGH_DPI only when its median line confidence is below
+# ADAPTIVE_MIN_CONF or no amount column is found
+ADAPTIVE_DPI = os.getenv("ADAPTIVE_DPI", "0") not in ("0", "false", "False", "")
+ADAPTIVE_LOW_DPI = int(os.getenv("ADAPTIVE_LOW_DPI", "150"))
+ADAPTIVE_HIGH_DPI = int(os.getenv("ADAPTIVE_HIGH_DPI", "300"))
+ADAPTIVE_MIN_CONF = int(os.getenv("ADAPTIVE_MIN_CONF", "70"))
+
+# Digital PDFs: pages whose embedded text layer has at least TEXT_LAYER_MIN_WORDS
+# words are read with `pdftotext -bbox` instead of being rasterized and OCR'd
+TEXT_LAYER_ENABLED = os.getenv("TEXT_LAYER_ENABLED", "1") not in ("0", "false", "False", "")
+TEXT_LAYER_MIN_WORDS = int(os.getenv("TEXT_LAYER_MIN_WORDS", "10"))
+
+# Region-of-interest OCR: OCR only the detected item table at full resolution and
+# the footer below it at ROI_FOOTER_SCALE
+ROI_OCR = os.getenv("ROI_OCR", "0") not in ("0", "false", "False", "")
+ROI_FOOTER_SCALE = float(os.getenv("ROI_FOOTER_SCALE", "0.5"))
+
+# Preprocessing stage before OCR: binarize and deskew (rotation skipped when the
+# estimated skew is below DESKEW_MIN_ANGLE degrees)
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "0") not in ("0", "false", "False", "")
+DESKEW_MIN_ANGLE = float(os.getenv("DESKEW_MIN_ANGLE", "0.3"))
+
+# OCR engine: "pytesseract" (one tesseract process per page) or "tesserocr"
+# (OCR_POOL_SIZE warm engines per worker process; needs the tesserocr package)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "pytesseract")
+OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", "1"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+# Rendered pages OCR'd per Tesseract invocation (1 = one call per page). Larger
+# chunks pay process startup / model loading once per chunk instead of per page.
+OCR_BATCH_PAGES = int(os.getenv("OCR_BATCH_PAGES", "1"))
+
+# Request-level result cache (keyed by document hash + EXTRACTOR_VERSION + params).
+# Bump EXTRACTOR_VERSION whenever extraction output changes.
+EXTRACTOR_VERSION = "4"
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "3600"))
+
+# Near-duplicate reuse: pages are dHashed at NEAR_DUP_DPI before OCR, and a document
+# whose pages are all within NEAR_DUP_MAX_DISTANCE bits of an earlier one (same page
+# count) is a candidate for that document's result. Bills from one template hash as
+# close as re-scans, so the candidate is only reused when an OCR of the new document
+# at NEAR_DUP_VERIFY_DPI finds every stored item amount and the same printed total.
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "0") not in ("0", "false", "False", "")
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "4"))
+NEAR_DUP_HASH_SIZE = int(os.getenv("NEAR_DUP_HASH_SIZE", "16"))
+NEAR_DUP_DPI = int(os.getenv("NEAR_DUP_DPI", "50"))
+NEAR_DUP_VERIFY_DPI = int(os.getenv("NEAR_DUP_VERIFY_DPI", "150"))
+NEAR_DUP_MAX_DOCUMENTS = int(os.getenv("NEAR_DUP_MAX_DOCUMENTS", "2000"))
+
+# Remote (http/https) documents
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(100 * 1024 * 1024)))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "60"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "20"))
+
+# Logging level for the API process (DEBUG enables per-line extractor traces)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -0,0 +1,86 @@
+# src/fetch.py
+"""
+Async document fetching for http(s) sources.
+One shared, connection-pooled httpx client; downloads are streamed to a temp
+file with a size limit and removed when the caller is done with them.
+"""
+import asyncio
+import contextlib
+import os
+import tempfile
+
+import httpx
+
+from src.config import FETCH_MAX_BYTES, FETCH_MAX_CONNECTIONS, FETCH_TIMEOUT
+from src import metrics
+from src.ocr import document_suffix, is_remote_document, normalize_document_path
+
+_client = None
+
+
+class DocumentTooLargeError(Exception):
+    pass
+
+
+def get_http_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=FETCH_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=FETCH_MAX_CONNECTIONS,
+                                max_keepalive_connections=FETCH_MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def fetch_to_tempfile(url, max_bytes=FETCH_MAX_BYTES):
+    """
+    Stream `url` into a temp file and return its path (the caller removes it).
+    Raises DocumentTooLargeError past max_bytes.
+    """
+    async with get_http_client().stream("GET", url) as resp:
+        resp.raise_for_status()
+        declared = resp.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise DocumentTooLargeError(f"document is {declared} bytes, limit is {max_bytes}")
+
+        fd, tmp_path = tempfile.mkstemp(suffix=document_suffix(url, resp.headers.get("content-type")))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                size = 0
+                async for chunk in resp.aiter_bytes(1024 * 64):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise DocumentTooLargeError(f"document exceeds the {max_bytes} byte limit")
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return tmp_path
+
+
+@contextlib.asynccontextmanager
+async def open_document(document):
+    """
+    Yield a local path for `document` (file://, local path or http(s) URL).
+    Downloaded documents are deleted on exit.
+    """
+    path = normalize_document_path(document)
+    if not is_remote_document(path):
+        yield path
+        return
+    with metrics.span("fetch"):
+        tmp_path = await fetch_to_tempfile(path)
+    try:
+        yield tmp_path
+    finally:
+        await asyncio.to_thread(os.remove, tmp_path)
+
@@ -0,0 +1,210 @@
+# src/jobs.py
+"""
+In-process batch job scheduler backed by a local SQLite job store.
+Jobs are queued by priority and processed by a fixed set of async workers that
+share the page process pool with the synchronous endpoint.
+
+Several server processes may share one store. Each job records the process that
+owns it, and every process heartbeats into the store; unfinished jobs are only
+failed by their own process on shutdown, or by any process once their owner's
+heartbeat has gone stale (it crashed or was killed).
+"""
+import asyncio
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from src.pipeline import extract_bill_cached
+from src.records import bill_to_dict
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+HEARTBEAT_INTERVAL = 10.0
+# an owner that has not heartbeated for this long is considered dead
+HEARTBEAT_TIMEOUT = 6 * HEARTBEAT_INTERVAL
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobStore:
+    def __init__(self, path, owner=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, document TEXT NOT NULL, priority INTEGER NOT NULL,"
+            " status TEXT NOT NULL, result TEXT, error TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS owners (owner TEXT PRIMARY KEY, heartbeat REAL NOT NULL)")
+        self._conn.commit()
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def create(self, document, priority=0):
+        return self.create_many([(document, priority)])[0]
+
+    def create_many(self, jobs):
+        """
+        jobs: list of (document, priority). Inserted in one transaction.
+        Returns the new job ids in order.
+        """
+        now = time.time()
+        rows = [(uuid.uuid4().hex, document, priority, QUEUED, self.owner, now, now) for document, priority in jobs]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO jobs (id, document, priority, status, owner, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+        return [row[0] for row in rows]
+
+    def update(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, document, priority, status, result, error, created_at, updated_at"
+                " FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "document": row[1],
+            "priority": row[2],
+            "status": row[3],
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    def heartbeat(self):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO owners (owner, heartbeat) VALUES (?, ?)", (self.owner, time.time())
+            )
+            self._conn.commit()
+
+    def fail_unfinished(self, reason):
+        """
+        Fail this process's queued/running jobs and drop its heartbeat (on shutdown).
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE owner = ? AND status IN (?, ?)",
+                (FAILED, reason, time.time(), self.owner, QUEUED, RUNNING),
+            )
+            self._conn.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+            self._conn.commit()
+
+    def fail_orphaned(self, reason, timeout=HEARTBEAT_TIMEOUT):
+        """
+        Fail unfinished jobs whose owner stopped heartbeating: they can't be resumed.
+        Jobs of live processes sharing the store are left alone.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?)"
+                " AND owner IS NOT ? AND (owner IS NULL OR owner NOT IN"
+                " (SELECT owner FROM owners WHERE heartbeat >= ?))",
+                (FAILED, reason, now, QUEUED, RUNNING, self.owner, now - timeout),
+            )
+            self._conn.execute("DELETE FROM owners WHERE heartbeat < ?", (now - timeout,))
+            self._conn.commit()
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobScheduler:
+    def __init__(self, store, workers=4, max_queue=1000):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = None
+        self._tasks = []
+        self._seq = itertools.count()
+        self._reserved = 0   # queue places held by submissions still being stored
+
+    async def start(self):
+        self.store.heartbeat()
+        self.store.fail_orphaned("interrupted by server restart")
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.fail_unfinished("server shut down before the job ran")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            await asyncio.to_thread(self.store.heartbeat)
+            await asyncio.to_thread(self.store.fail_orphaned, "server process died")
+
+    async def submit_many(self, documents):
+        """
+        documents: list of (document, priority, projection) tuples, where projection
+        holds the bill_to_dict keyword arguments for the stored result.
+        All-or-nothing: raises QueueFullError if the batch does not fit in the queue.
+        The jobs are stored in one transaction, off the event loop.
+        """
+        if self._queue.maxsize - self._queue.qsize() - self._reserved < len(documents):
+            raise QueueFullError(f"job queue full ({self._queue.qsize()}/{self._queue.maxsize})")
+        self._reserved += len(documents)
+        try:
+            job_ids = await asyncio.to_thread(self.store.create_many, [(d, p) for d, p, _ in documents])
+        finally:
+            self._reserved -= len(documents)
+        for job_id, (document, priority, projection) in zip(job_ids, documents):
+            # higher priority first, FIFO within the same priority
+            self._queue.put_nowait((-priority, next(self._seq), job_id, document, projection))
+        return job_ids
+
+    async def _worker(self):
+        while True:
+            _, _, job_id, document, projection = await self._queue.get()
+            try:
+                self.store.update(job_id, RUNNING)
+                data, _ = await extract_bill_cached(document, include_lines=projection.get("include_lines", False))
+                self.store.update(job_id, DONE, result=bill_to_dict(data, **projection))
+            except asyncio.CancelledError:
+                self.store.update(job_id, FAILED, error="cancelled")
+                raise
+            except Exception as e:
+                self.store.update(job_id, FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
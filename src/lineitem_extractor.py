@@ -3,14 +3,19 @@
 Flexible extractor (Option B) with stricter noise filtering and safer name+amount rules.
 Replace your existing file with this one.
 """
+import logging
 import re
 import statistics
 import typing
+from src.metrics import span
 from src.ocr import run_ocr_on_image
-from src.table_detector import extract_rows_from_ocr
+from src.records import BillItem, Line, item_key
+from src.config import PREPROCESS_ENABLED, ROI_OCR
+from src.preprocess import deskew_and_binarize
+from src.table_detector import build_page_geometry, extract_rows_from_ocr, run_table_region_ocr, LINE_TOP_TOLERANCE
 from src.utils import parse_money
 
-DEBUG = True
+logger = logging.getLogger(__name__)
 
 BLACKLIST_KEYWORDS = [
     "total", "subtotal", "sub total", "grand total", "gst", "tax", "invoice", "bill", "page",
@@ -29,20 +34,41 @@ JSON_LIKE_PATTERNS = [
     r'\b"item quantity"\b',
 ]
 
+NOISE_WORDS = [
+    "sample document", "sample", "description", "page", "printed on", "request format",
+    "http", "https", "sv=", "%3a", "document"
+]
+
+# pixel thresholds below are calibrated for pages rendered at REFERENCE_DPI
+REFERENCE_DPI = 300
 AMOUNT_TOLERANCE = 55
+CONTINUATION_MAX_LEFT = 300
 MIN_NAME_ALPHA = 3   # tighten: require at least 3 alphabetic chars in final name
 
+
+def _keyword_re(keywords):
+    # one alternation per keyword list instead of a substring scan per keyword
+    return re.compile("|".join(re.escape(k) for k in sorted(set(keywords), key=len, reverse=True)))
+
+
+_JSON_LIKE_RE = re.compile("|".join(f"(?:{p})" for p in JSON_LIKE_PATTERNS), flags=re.I)
+_BLACKLIST_RE = _keyword_re(BLACKLIST_KEYWORDS)
+_NOISE_RE = _keyword_re(NOISE_WORDS)
+_NUMERIC_ONLY_RE = re.compile(r"[\d\.,\s]+")
+_NUMERIC_TOKEN_RE = re.compile(r"\d+[.,]?\d*")
+_TIMESTAMP_OR_QUERY_RE = re.compile(r'\d{2}[:/]\d{2}|\d{4}-\d{2}-\d{2}|%3A|sv=')
+
 def _debug(*args):
-    if DEBUG:
-        print(*args)
+    # called per OCR line: only format the message when debug logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(" ".join(str(a) for a in args))
 
 
 def looks_like_total_line(text_lc):
-    for kw in BLACKLIST_KEYWORDS:
-        if kw in text_lc:
-            return True
+    if _BLACKLIST_RE.search(text_lc):
+        return True
     # If line is purely numeric tokens (likely totals/indices), treat as total/footer
-    if re.fullmatch(r"[\d\.,\s]+", text_lc):
+    if _NUMERIC_ONLY_RE.fullmatch(text_lc):
         return True
     return False
 
@@ -50,10 +76,9 @@ def looks_like_total_line(text_lc):
 def _estimate_amount_column(lines):
     rightmost_lefts = []
     for ln in lines:
-        if not ln.get("words"):
+        if not ln.words:
             continue
-        w = ln["words"][-1]
-        rightmost_lefts.append(w["left"])
+        rightmost_lefts.append(ln.words[-1].left)
     if not rightmost_lefts:
         return None
     try:
@@ -85,6 +110,26 @@ def _clean_name_from_json_noise(text):
     return cleaned
 
 
+def _column_qty_rate(words, geometry):
+    """
+    (qty, rate) read from the words sitting in the page's qty / rate columns
+    (0.0 when the page has no such column, so serial numbers never stand in);
+    None when the page has no amount column (callers fall back to line tokens).
+    """
+    if geometry is None or geometry.role_index("amount") is None:
+        return None
+    qty = rate = 0.0
+    for w in words:
+        role = geometry.role_of(w)
+        if role in ("qty", "rate") and _is_price_token(w.text):
+            value = parse_money(w.text) or 0.0
+            if role == "qty":
+                qty = value
+            else:
+                rate = value
+    return qty, rate
+
+
 def _parse_candidate_amount(token_text):
     nums = re.findall(r"\d+[.,]?\d*", token_text)
     return parse_money(nums[-1]) if nums else parse_money(token_text)
@@ -97,15 +142,16 @@ _HEADER_FOOTER_KEYWORDS = [
     "page of", "printed on :", "of", "printed", "sample 1", "sample 2", "sample 3"
 ]
 
+_HEADER_FOOTER_RE = _keyword_re(_HEADER_FOOTER_KEYWORDS)
+
 _AMT_CANDIDATE_RE = re.compile(r'[-+]?\d{1,3}(?:[,.\s]\d{3})*(?:\.\d{1,2})?$')
 
 def looks_like_header_footer(text: str) -> bool:
     if not text:
         return True
     t = text.strip().lower()
-    for k in _HEADER_FOOTER_KEYWORDS:
-        if k in t:
-            return True
+    if _HEADER_FOOTER_RE.search(t):
+        return True
     if t.startswith("http") or "%" in t or "sv=" in t:
         return True
     # Reject tiny alphabetic tokens like "Page"
@@ -113,26 +159,47 @@ def looks_like_header_footer(text: str) -> bool:
         return True
     return False
 
-def filter_header_footer_lines(raw_lines: typing.List[typing.Union[str, dict]]):
+def classify_line(ln):
+    """
+    Tag a line once with every filter the extractor needs:
+      json_like, total, header_footer, timestamp, page_number, numeric_tokens
+    ln: Line record (tags are cached on it) or a plain string.
+    """
+    if isinstance(ln, Line):
+        if ln.tags is not None:
+            return ln.tags
+        text = ln.text
+    else:
+        text = str(ln)
+    txt = text.strip()
+    toks = txt.split()
+    tags = {
+        "json_like": bool(_JSON_LIKE_RE.search(txt)),
+        "total": looks_like_total_line(txt.lower()),
+        "header_footer": looks_like_header_footer(txt),
+        # timestamps or long query strings
+        "timestamp": bool(_TIMESTAMP_OR_QUERY_RE.search(txt)),
+        # single-token numeric page numbers (1, 2, 09, etc)
+        "page_number": len(toks) == 1 and toks[0].isdigit() and len(toks[0]) <= 3,
+        "numeric_tokens": _NUMERIC_TOKEN_RE.findall(txt),
+    }
+    if isinstance(ln, Line):
+        ln.tags = tags
+    return tags
+
+
+def filter_header_footer_lines(raw_lines: typing.List[typing.Union[str, Line]]):
     """
     Remove obvious headers/footers and short page-number tokens from OCR lines.
-    raw_lines: list of dicts (with 'text') or strings
+    raw_lines: list of Line records or strings
     """
     out = []
     for ln in raw_lines:
-        text = ln.get("text", "") if isinstance(ln, dict) else str(ln)
-        txt = text.strip()
-        if not txt:
-            continue
-        # drop obvious header/footer patterns
-        if looks_like_header_footer(txt):
-            continue
-        # drop single-token numeric page numbers (1, 2, 09, etc)
-        toks = txt.split()
-        if len(toks) == 1 and toks[0].isdigit() and len(toks[0]) <= 3:
+        text = ln.text if isinstance(ln, Line) else str(ln)
+        if not text.strip():
             continue
-        # drop things that look like timestamps or long query strings
-        if re.search(r'\d{2}[:/]\d{2}|\d{4}-\d{2}-\d{2}|%3A|sv=', txt):
+        tags = classify_line(ln)
+        if tags["header_footer"] or tags["page_number"] or tags["timestamp"]:
             continue
         out.append(ln)
     return out
@@ -152,20 +219,13 @@ def split_merged_line(raw_text):
         name = _clean_name_from_json_noise(name)
         name = _strip_trailing_number_chars(name)
         if name and amount > 0:
-            results.append({
-                "item_name": name,
-                "item_quantity": float(qty),
-                "item_rate": float(rate),
-                "item_amount": float(amount),
-                "confidence": 90,
-                "origin": "split_line"
-            })
+            results.append(BillItem(name, float(qty), float(rate), float(amount), 90, "split_line"))
     return results
 
 # ------------------ JSON-like parsing ------------------
 
 def parse_json_like_records_from_lines(lines):
-    texts = [ln.get("text", "").strip() for ln in lines]
+    texts = [ln.text.strip() for ln in lines]
     items = []
     for idx, txt in enumerate(texts):
         if re.search(r'\"?item\s*name\"?\s*[:=]', txt, flags=re.I):
@@ -198,21 +258,50 @@ def parse_json_like_records_from_lines(lines):
             if name_val:
                 clean_name = _clean_name_from_json_noise(name_val)
                 if clean_name and amount and amount > 0:
-                    items.append({
-                        "item_name": clean_name,
-                        "item_quantity": float(qty),
-                        "item_rate": float(rate),
-                        "item_amount": float(amount),
-                        "confidence": 90,
-                        "origin": "json_mode"
-                    })
+                    items.append(BillItem(clean_name, float(qty), float(rate), float(amount), 90, "json_mode"))
     return items
 
 # ------------------ Visual extractor (Flexible, safer rules) ------------------
 
-def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_confidence=40):
+def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_confidence=40, dpi=REFERENCE_DPI,
+                                                       geometry=None):
+    """
+    geometry: PageGeometry of the page (built from `lines` when not given). When
+    it finds numeric columns, the amount column, qty/rate values and item-name
+    continuation lines come from it; otherwise the fixed thresholds below apply.
+    """
+    scale = dpi / REFERENCE_DPI
+    amount_tolerance = AMOUNT_TOLERANCE * scale
+    continuation_max_left = CONTINUATION_MAX_LEFT * scale
+    if geometry is None:
+        geometry = build_page_geometry(lines, scale)
+    amount_col = geometry.role_index("amount")
+
+    def in_amount_column(word, fallback_left):
+        if amount_col is not None:
+            return geometry.column_at(word.left, word.right) == amount_col
+        return (amount_col_x is None) or (abs(fallback_left - amount_col_x) <= amount_tolerance)
+
+    def description_span(ln):
+        # from the item's first word outside the numeric columns (after any S.No)
+        # to the first column right of it; None when there is no such column
+        text_words = [w for w in ln.words if geometry.column_at(w.left, w.right) is None]
+        left = text_words[0].left if text_words else ln.min_left
+        right = next((start for start, _ in geometry.columns if start > left), None)
+        return None if right is None else (left, right)
+
+    def is_continuation(ln, span):
+        if span is None:
+            return ln.min_left <= continuation_max_left
+        # text only, starting in the left half of the previous item's description span
+        if any(geometry.column_at(w.left, w.right) is not None for w in ln.words):
+            return False
+        left, right = span
+        return ln.min_left <= left + (right - left) / 2
+
     items = []
     last_item = None
+    last_item_span = None
     n = len(lines)
     i = 0
 
@@ -230,15 +319,19 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
 
     while i < n:
         ln = lines[i]
-        raw_text = ln.get("text", "").strip()
+        raw_text = ln.text.strip()
         _debug("LINE", i + 1, ":", raw_text)
-        if not raw_text or ln.get("avg_conf", -1) < min_confidence:
+        if not raw_text or ln.avg_conf < min_confidence:
             last_item = None
             i += 1
             continue
 
-        # split merged lines first (explicit qty+rate+amount all present)
-        splits = split_merged_line(raw_text)
+        tags = classify_line(ln)
+        numeric_tokens = tags["numeric_tokens"]
+
+        # split merged lines first (explicit qty+rate+amount all present,
+        # so a line needs at least three numeric tokens to be a candidate)
+        splits = split_merged_line(raw_text) if len(numeric_tokens) >= 3 else []
         if splits:
             _debug("SPLIT merged line into", len(splits), "items")
             for s in splits:
@@ -248,23 +341,17 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
             continue
 
         # skip JSON-like noise lines
-        json_like = False
-        for pat in JSON_LIKE_PATTERNS:
-            if re.search(pat, raw_text, flags=re.I):
-                json_like = True
-                break
-        if json_like:
+        if tags["json_like"]:
             last_item = None
             i += 1
             continue
 
-        text_lc = raw_text.lower()
-        if looks_like_total_line(text_lc):
+        if tags["total"]:
             last_item = None
             i += 1
             continue
 
-        words = ln.get("words", [])
+        words = ln.words
         if not words:
             last_item = None
             i += 1
@@ -272,10 +359,10 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
 
         # candidate 1: rightmost token is price and near amount column
         rightmost = words[-1]
-        right_text = rightmost.get("text", "").strip()
-        right_left = rightmost.get("left", 0)
+        right_text = rightmost.text.strip()
+        right_left = rightmost.left
         is_price_here = _is_price_token(right_text)
-        close_here = (amount_col_x is None) or (abs(right_left - amount_col_x) <= AMOUNT_TOLERANCE)
+        close_here = in_amount_column(rightmost, right_left)
 
         amount_used = None
         name_used = None
@@ -284,12 +371,15 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
 
         if is_price_here and close_here:
             amount_used = _parse_candidate_amount(right_text)
-            # attempt to get qty/rate from line numeric tokens
-            numeric_tokens = re.findall(r"\d+[.,]?\d*", raw_text)
-            if len(numeric_tokens) >= 2:
-                rate = parse_money(numeric_tokens[-2])
-            if len(numeric_tokens) >= 3:
-                qty = parse_money(numeric_tokens[-3])
+            # qty/rate from their columns, else from the line's numeric tokens
+            column_values = _column_qty_rate(words[:-1], geometry)
+            if column_values is not None:
+                qty, rate = column_values
+            else:
+                if len(numeric_tokens) >= 2:
+                    rate = parse_money(numeric_tokens[-2])
+                if len(numeric_tokens) >= 3:
+                    qty = parse_money(numeric_tokens[-3])
             name_candidate = _clean_name_from_json_noise(raw_text)
             name_used = _strip_trailing_number_chars(name_candidate)
             _debug("ACCEPT direct:", name_used, amount_used)
@@ -297,19 +387,21 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
             # candidate 2: next line numeric-only and aligned AND looks like money token (dot/comma or >=3 digits)
             if i + 1 < n:
                 next_ln = lines[i + 1]
-                next_text = next_ln.get("text", "").strip()
+                next_text = next_ln.text.strip()
                 if re.fullmatch(r'[\d\.,\s₹$€£]+', next_text):
                     if looks_like_money_token(next_text):
-                        next_words = next_ln.get("words", [])
+                        next_words = next_ln.words
                         if next_words:
                             next_right = next_words[-1]
-                            next_left = next_right.get("left", 0)
-                            close_next = (amount_col_x is None) or (abs(next_left - amount_col_x) <= AMOUNT_TOLERANCE)
+                            next_left = next_right.left
+                            close_next = in_amount_column(next_right, next_left)
                             if close_next:
                                 amount_used = _parse_candidate_amount(next_text)
-                                # attempt to get qty/rate from raw_text numeric tokens
-                                numeric_tokens = re.findall(r"\d+[.,]?\d*", raw_text)
-                                if len(numeric_tokens) >= 1:
+                                # qty/rate from their columns, else from raw_text numeric tokens
+                                column_values = _column_qty_rate(words, geometry)
+                                if column_values is not None:
+                                    qty, rate = column_values
+                                elif len(numeric_tokens) >= 1:
                                     # if raw_text has numeric tokens, treat them as qty/rate candidates
                                     if len(numeric_tokens) >= 2:
                                         rate = parse_money(numeric_tokens[-1])
@@ -334,8 +426,7 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
                 # tighten name checks
                 clean_name_alpha = re.sub(r'[^A-Za-z]+', '', (name_used or ""))
                 nl = (name_used or "").lower()
-                NOISE_WORDS = ["sample document", "sample", "description", "page", "printed on", "request format", "http", "https", "sv=", "%3a", "document"]
-                if any(k in nl for k in NOISE_WORDS):
+                if _NOISE_RE.search(nl):
                     _debug("DROP (noise word in name):", name_used, amount_used)
                     amount_used = None
                 elif len(clean_name_alpha) < MIN_NAME_ALPHA:
@@ -346,16 +437,17 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
             name_alpha = re.sub(r"[^A-Za-z]+", "", name_used or "")
             # require at least MIN_NAME_ALPHA alphabetic chars
             if len(name_alpha) >= MIN_NAME_ALPHA:
-                item = {
-                    "item_name": name_used if name_used else raw_text,
-                    "item_quantity": float(qty),
-                    "item_rate": float(rate),
-                    "item_amount": float(amount_used),
-                    "confidence": int(ln.get("avg_conf", -1)) if ln.get("avg_conf") is not None else -1,
-                    "origin": "visual"
-                }
+                item = BillItem(
+                    item_name=name_used if name_used else raw_text,
+                    item_quantity=float(qty),
+                    item_rate=float(rate),
+                    item_amount=float(amount_used),
+                    confidence=int(ln.avg_conf) if ln.avg_conf is not None else -1,
+                    origin="visual"
+                )
                 items.append(item)
                 last_item = item
+                last_item_span = description_span(ln)
             else:
                 _debug("REJECT short name after cleaning:", name_used)
                 last_item = None
@@ -363,11 +455,10 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
             # no amount found for this line; maybe continuation of previous item name
             if last_item:
                 try:
-                    left_cur = ln.get("min_left", 9999)
-                    if left_cur <= 300:
+                    if is_continuation(ln, last_item_span):
                         cont_text = _clean_name_from_json_noise(raw_text)
-                        last_item["item_name"] = (last_item["item_name"] + " " + cont_text).strip()
-                        last_item["confidence"] = int((last_item.get("confidence", 0) + ln.get("avg_conf", 0)) // 2)
+                        last_item.item_name = (last_item.item_name + " " + cont_text).strip()
+                        last_item.confidence = int((last_item.confidence + ln.avg_conf) // 2)
                     else:
                         last_item = None
                 except Exception:
@@ -378,10 +469,10 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
 
     # debug summary: print extracted items + total
     try:
-        total = sum(float(it.get("item_amount", 0.0)) for it in items)
+        total = sum(float(it.item_amount) for it in items)
         _debug("EXTRACTED ITEMS COUNT:", len(items), "SUM AMOUNT:", total)
         for it in items[:16]:
-            _debug("  ITEM:", it.get("item_name"), it.get("item_amount"))
+            _debug("  ITEM:", it.item_name, it.item_amount)
     except Exception:
         pass
 
@@ -390,53 +481,80 @@ def conservative_extract_from_lines_with_split_support(lines, amount_col_x, min_
 
 # ------------------ Main page extractor ------------------
 
-def extract_pagewise_line_items(img, page_no="1", conservative_min_conf=40):
-    ocr = run_ocr_on_image(img)
-    lines = extract_rows_from_ocr(ocr, min_confidence=10)
-    if not lines:
-        return {"page_no": page_no, "page_type": "Bill Detail", "bill_items": [], "lines": lines}
+def page_needs_rescan(page_result, min_conf):
+    """
+    Decide whether a page OCR'd at low resolution should be redone at high DPI:
+    median line confidence below min_conf, or no amount column could be found.
+    """
+    confs = [ln.avg_conf for ln in page_result.get("ocr_lines", []) if ln.avg_conf >= 0]
+    if not confs or statistics.median(confs) < min_conf:
+        return True
+    return _estimate_amount_column(page_result.get("lines", [])) is None
 
+
+def extract_pagewise_line_items(img, page_no="1", conservative_min_conf=40, dpi=REFERENCE_DPI, ocr=None):
+    """
+    OCR one page image (or take ready-made image_to_data-shaped `ocr`, e.g. from
+    the PDF text layer) and extract its bill items.
+    """
+    if ocr is None:
+        if PREPROCESS_ENABLED:
+            with span("preprocess"):
+                img = deskew_and_binarize(img)
+        ocr = run_table_region_ocr(img, dpi=dpi) if ROI_OCR else run_ocr_on_image(img, dpi=dpi)
+    line_tolerance = max(1, round(LINE_TOP_TOLERANCE * dpi / REFERENCE_DPI))
+    with span("line_grouping"):
+        ocr_lines = extract_rows_from_ocr(ocr, min_confidence=10, line_tolerance=line_tolerance)
+    if not ocr_lines:
+        return {"page_no": page_no, "page_type": "Bill Detail", "bill_items": [], "lines": ocr_lines,
+                "ocr_lines": ocr_lines}
+
+    with span("extraction"):
+        lines, clean = _page_items(ocr_lines, conservative_min_conf, dpi)
+    return {"page_no": page_no, "page_type": "Bill Detail", "bill_items": clean, "lines": lines,
+            "ocr_lines": ocr_lines}
+
+
+def _page_items(ocr_lines, conservative_min_conf, dpi):
+    """
+    Filter, parse and clean one page's grouped OCR lines.
+    Returns (filtered lines, bill items).
+    """
     # apply header/footer & noise filter BEFORE any parsing
-    lines = filter_header_footer_lines(lines)
+    # (unfiltered lines are kept in "ocr_lines" so printed totals can be found without re-OCR)
+    lines = filter_header_footer_lines(ocr_lines)
 
-    # detect whether page looks JSON-like
-    json_like_count = 0
-    for ln in lines:
-        t = ln.get("text", "")
-        for pat in JSON_LIKE_PATTERNS:
-            if re.search(pat, t, flags=re.I):
-                json_like_count += 1
-                break
+    # detect whether page looks JSON-like (tags were computed by the filter above)
+    json_like_count = sum(1 for ln in lines if classify_line(ln)["json_like"])
 
     items = []
     if json_like_count >= max(3, len(lines) // 6):
         _debug("JSON-like page detected, parsing JSON-like records")
         items = parse_json_like_records_from_lines(lines)
         visual = conservative_extract_from_lines_with_split_support(lines, _estimate_amount_column(lines),
-                                                                  min_confidence=conservative_min_conf)
+                                                                  min_confidence=conservative_min_conf, dpi=dpi)
         items.extend(visual)
     else:
         items = conservative_extract_from_lines_with_split_support(lines, _estimate_amount_column(lines),
-                                                                  min_confidence=conservative_min_conf)
+                                                                  min_confidence=conservative_min_conf, dpi=dpi)
 
     # ---------------- stricter post-clean and dedupe ----------------
     clean = []
     seen = set()
-    NOISE_WORDS = ["sample document", "sample", "description", "page", "printed on", "request format", "http", "https", "sv=", "%3A", "document"]
 
     for it in items:
         try:
-            amt = float(it.get("item_amount", 0.0))
+            amt = float(it.item_amount)
         except Exception:
             continue
         if amt <= 0:
             continue
 
-        name = it.get("item_name", "").strip()
+        name = it.item_name.strip()
         nl = name.lower()
 
         # drop obvious header/footer / url / sample noise
-        if any(k in nl for k in NOISE_WORDS):
+        if _NOISE_RE.search(nl):
             _debug("DROPPING noise item:", name, amt)
             continue
 
@@ -445,17 +563,14 @@ def extract_pagewise_line_items(img, page_no="1", conservative_min_conf=40):
             _debug("DROPPING short-alpha name:", name)
             continue
 
-        # normalize for dedupe: amount + first 14 alphanumeric chars of the name
-        norm_name = re.sub(r'[^a-z0-9]', '', nl)[:14]
-        key = (round(amt, 2), norm_name)
+        key = item_key(name, amt)
 
         if key in seen:
             _debug("DUPLICATE drop:", name, amt)
             continue
         seen.add(key)
 
-        it["item_name"] = name
+        it.item_name = name
         clean.append(it)
 
-    # return cleaned items
-    return {"page_no": page_no, "page_type": "Bill Detail", "bill_items": clean, "lines": lines} 
\ No newline at end of file
+    return lines, clean 
\ No newline at end of file
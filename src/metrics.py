@@ -0,0 +1,81 @@
+# src/metrics.py
+"""
+Per-stage timing spans and counters, exported in Prometheus format at /metrics.
+
+Pool worker processes cannot update the API process's registry, so they buffer
+their observations; the pipeline ships the buffer back with each page result
+and merges it here (see pipeline._run_with_metrics).
+"""
+import contextlib
+import threading
+import time
+
+from prometheus_client import Counter, Histogram
+
+STAGE_SECONDS = Histogram(
+    "bill_stage_seconds", "Time spent per pipeline stage", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+EVENTS = Counter("bill_events_total", "Pipeline event counts (pages, items, cache hits...)", ["event"])
+
+_worker_mode = False
+_buffer_lock = threading.Lock()
+_timings = []
+_events = {}
+
+
+def set_worker_mode():
+    """
+    Called in pool worker processes: buffer observations instead of exporting them.
+    """
+    global _worker_mode
+    _worker_mode = True
+
+
+def observe(stage, seconds):
+    if _worker_mode:
+        with _buffer_lock:
+            _timings.append((stage, seconds))
+    else:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def count(event, n=1):
+    if _worker_mode:
+        with _buffer_lock:
+            _events[event] = _events.get(event, 0) + n
+    else:
+        EVENTS.labels(event).inc(n)
+
+
+@contextlib.contextmanager
+def span(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+
+def drain():
+    """
+    Worker side: return and clear buffered observations.
+    """
+    global _timings, _events
+    with _buffer_lock:
+        snapshot = (_timings, _events)
+        _timings, _events = [], {}
+    return snapshot
+
+
+def merge(snapshot):
+    """
+    API side: export observations drained from a worker process.
+    """
+    if not snapshot:
+        return
+    timings, events = snapshot
+    for stage, seconds in timings:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    for event, n in events.items():
+        EVENTS.labels(event).inc(n)
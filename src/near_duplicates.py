@@ -0,0 +1,213 @@
+# src/near_duplicates.py
+"""
+Near-duplicate document detection before OCR.
+Every page gets a difference hash (dHash) computed on a low-resolution render;
+documents are indexed by their first page hash in a BK-tree (Hamming metric),
+so a lookup only visits the part of the tree within the distance threshold.
+A candidate matches when it has the same page count and every page is within
+the threshold. Bills printed from one template can hash as close as two scans
+of the same bill (whatever the customer or item rows), so before a match is
+reused a cheap low-resolution OCR of the new document must find every stored
+item amount on its page and the same printed total.
+"""
+import itertools
+import re
+from collections import Counter, OrderedDict
+
+from PIL import Image, ImageOps
+
+from src.ocr import iter_document_images, iter_pdf_pages, run_ocr_on_image
+from src.reconciler import find_printed_total_in_lines
+from src.table_detector import extract_rows_from_ocr
+
+# image inputs are taken as scans at this resolution
+_IMAGE_DPI = 300
+
+_AMOUNT_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+def dhash(img, hash_size=16):
+    """
+    Difference hash of a PIL image: hash_size*hash_size bits, one per
+    horizontally adjacent pixel pair of a (hash_size+1) x hash_size thumbnail.
+    The page is cropped to its ink first: a whole mostly-white page shrinks to a
+    near-uniform thumbnail whose bits say little about the content.
+    """
+    gray = img.convert("L")
+    # anything clearly darker than the paper counts as ink; faint (blurred or
+    # downscaled) strokes must still count or the box shifts between copies
+    lo, hi = gray.getextrema()
+    cut = hi - (hi - lo) // 4
+    bbox = gray.point(lambda v: 255 if v < cut else 0).getbbox() if hi - lo > 32 else None
+    if bbox:
+        gray = gray.crop(bbox)
+    small = ImageOps.autocontrast(gray.resize((hash_size + 1, hash_size), Image.BOX))
+    px = small.tobytes()
+    row = hash_size + 1
+    value = 0
+    for y in range(hash_size):
+        base = y * row
+        for x in range(hash_size):
+            value = (value << 1) | (px[base + x] > px[base + x + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def document_hashes(path, dpi=50, hash_size=16):
+    """
+    dHash of every page of a local document, rendered at a low DPI.
+    """
+    return [dhash(img, hash_size) for img in iter_document_images(path, dpi=dpi)]
+
+
+def _pages_at(path, dpi):
+    if path.lower().endswith(".pdf"):
+        for _, page in iter_pdf_pages(path, dpi=dpi):
+            yield page
+        return
+    page = Image.open(path).convert("L")
+    factor = dpi / _IMAGE_DPI
+    if factor < 1:
+        page = page.resize((max(1, int(page.width * factor)), max(1, int(page.height * factor))))
+    yield page
+
+
+def verification_digest(data):
+    """
+    What verify_near_duplicate checks a stored extract_bill() result against:
+    ({page number: item amounts}, printed total).
+    """
+    amounts = {int(p["page_no"]): [round(it.item_amount, 2) for it in p["bill_items"]]
+               for p in data["pagewise_line_items"]}
+    return amounts, data.get("printed_total")
+
+
+def verify_near_duplicate(path, digest, dpi=150):
+    """
+    OCR every page of a local document at `dpi` and check it against a
+    candidate's verification_digest(): each stored item amount must be read on
+    its page and the printed total must be the same. Stops at the first page
+    that doesn't match.
+    """
+    amounts, printed_total = digest
+    if printed_total is None:
+        return False
+    lines = []
+    for page_no, page in enumerate(_pages_at(path, dpi), start=1):
+        page_lines = extract_rows_from_ocr(run_ocr_on_image(page, dpi=dpi), min_confidence=10, with_words=False)
+        found = Counter(round(float(tok.replace(",", "")), 2)
+                        for ln in page_lines for tok in _AMOUNT_RE.findall(ln.text))
+        if Counter(amounts.get(page_no, [])) - found:
+            return False
+        lines.extend(page_lines)
+    printed = find_printed_total_in_lines(lines)
+    return printed is not None and abs(printed - printed_total) <= 0.005
+
+
+def replay_data(data):
+    """
+    What replaying an extract_bill() result needs: items and totals, without
+    any OCR lines.
+    """
+    pages = [{k: v for k, v in p.items() if k not in ("lines", "ocr_lines")} for p in data["pagewise_line_items"]]
+    return {**data, "pagewise_line_items": pages}
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance.
+    Nodes are [hash, values, {distance: child}].
+    """
+    __slots__ = ("_root",)
+
+    def __init__(self):
+        self._root = None
+
+    def add(self, h, value):
+        if self._root is None:
+            self._root = [h, [value], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [value], {}]
+                return
+            node = child
+
+    def search(self, h, max_distance):
+        """
+        All (distance, value) pairs within max_distance of h.
+        """
+        out = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= max_distance:
+                out.extend((d, v) for v in node[1])
+            # triangle inequality: only children at distance d±max_distance can match
+            for child_d, child in node[2].items():
+                if d - max_distance <= child_d <= d + max_distance:
+                    stack.append(child)
+        return out
+
+
+class NearDuplicateIndex:
+    """
+    In-memory index of extracted documents keyed by page hashes. Keeps the
+    most recently used max_documents entries (store replay_data() copies);
+    evicted entries are dropped from the tree when it is rebuilt.
+    """
+    def __init__(self, max_distance=4, max_documents=2000):
+        self.max_distance = max_distance
+        self.max_documents = max_documents
+        self._tree = BKTree()
+        self._docs = OrderedDict()   # doc id -> (page hashes, params, data)
+        self._ids = itertools.count()
+        self._stale = 0
+
+    def find(self, hashes, params):
+        """
+        Stored data of the closest matching document, or None.
+        params: extraction parameters; only results produced with the same ones match.
+        """
+        if not hashes:
+            return None
+        best = None
+        for _, doc_id in self._tree.search(hashes[0], self.max_distance):
+            entry = self._docs.get(doc_id)
+            if entry is None or entry[1] != params or len(entry[0]) != len(hashes):
+                continue
+            distance = max(hamming(a, b) for a, b in zip(hashes, entry[0]))
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, doc_id)
+        if best is None:
+            return None
+        self._docs.move_to_end(best[1])
+        return self._docs[best[1]][2]
+
+    def add(self, hashes, params, data):
+        if not hashes:
+            return
+        doc_id = next(self._ids)
+        self._docs[doc_id] = (hashes, params, data)
+        self._tree.add(hashes[0], doc_id)
+        while len(self._docs) > self.max_documents:
+            self._docs.popitem(last=False)
+            self._stale += 1
+        if self._stale > self.max_documents:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._tree = BKTree()
+        for doc_id, (hashes, _, _) in self._docs.items():
+            self._tree.add(hashes[0], doc_id)
+        self._stale = 0
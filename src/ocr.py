@@ -1,15 +1,27 @@
+import html
+import logging
 import os
+import queue
+import re
+import shlex
+import subprocess
 import tempfile
 import requests
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 import pytesseract
 from urllib.parse import urlparse
-from src.config import POPPLER_PATH
+from src.config import (
+    POPPLER_PATH, PDF_PAGE_WINDOW, TEXT_LAYER_MIN_WORDS,
+    OCR_BACKEND, OCR_POOL_SIZE, OCR_LANG,
+)
+from src.metrics import count, span
+from src.ocr_cache import get_ocr_cache, ocr_cache_key
 
 
 #pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
+logger = logging.getLogger(__name__)
 
 
 def _normalize_local_path(path):
@@ -24,38 +36,408 @@ def _normalize_local_path(path):
     return path
 
 
-def load_document_images(document_path, dpi=300):
+_CONTENT_TYPE_SUFFIXES = {
+    "application/pdf": ".pdf",
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/tiff": ".tiff",
+    "image/bmp": ".bmp",
+    "image/webp": ".webp",
+}
+
+
+def is_remote_document(document_path):
+    return str(document_path).lower().startswith(("http://", "https://"))
+
+
+def document_suffix(url, content_type=None):
+    """
+    File suffix for a downloaded document: from the URL path, else the
+    Content-Type, else assume PDF.
+    """
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    if ext in (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"):
+        return ext
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    return _CONTENT_TYPE_SUFFIXES.get(ctype, ".pdf")
+
+
+def normalize_document_path(document_path):
     # Normalize path for file:// or raw local paths
     if document_path.startswith("file://") or document_path.startswith("FILE://"):
         document_path = _normalize_local_path(document_path)
-    document_path = _normalize_local_path(document_path)
+    return _normalize_local_path(document_path)
+
 
-    # If it is a URL, download PDF temporarily
-    if str(document_path).lower().startswith(("http://", "https://")):
+def resolve_document_path(document_path):
+    """
+    Normalize file:// and local paths; download http(s) documents to a temp file
+    (blocking; the API uses src.fetch instead). The caller owns the temp file.
+    """
+    document_path = normalize_document_path(document_path)
+
+    # If it is a URL, download it temporarily
+    if is_remote_document(document_path):
         resp = requests.get(document_path, stream=True, timeout=60)
         resp.raise_for_status()
-        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
-        os.close(fd)
-        with open(tmp_path, "wb") as f:
-            for chunk in resp.iter_content(1024 * 64):
-                if chunk:
-                    f.write(chunk)
+        fd, tmp_path = tempfile.mkstemp(suffix=document_suffix(document_path, resp.headers.get("content-type")))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in resp.iter_content(1024 * 64):
+                    if chunk:
+                        f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
         document_path = tmp_path
+    return document_path
+
+
+def pdf_page_count(pdf_path):
+    poppler_arg = {"poppler_path": POPPLER_PATH} if POPPLER_PATH else {}
+    return int(pdfinfo_from_path(pdf_path, **poppler_arg)["Pages"])
+
+
+def iter_pdf_pages(pdf_path, page_numbers=None, dpi=300, window=PDF_PAGE_WINDOW):
+    """
+    Yield (page_no, PIL image) for the requested 1-based pages of a local PDF
+    (all pages by default), rendering consecutive pages `window` at a time.
+    """
+    poppler_arg = {"poppler_path": POPPLER_PATH} if POPPLER_PATH else {}
+    if page_numbers is None:
+        page_numbers = range(1, pdf_page_count(pdf_path) + 1)
+    window = max(1, int(window))
+
+    # group requested pages into consecutive runs no longer than `window`
+    runs = []
+    for n in sorted(page_numbers):
+        if runs and n == runs[-1][1] + 1 and n - runs[-1][0] < window:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n])
 
-    # If PDF, convert to images using Poppler
-    if document_path.lower().endswith(".pdf"):
-        poppler_arg = {"poppler_path": POPPLER_PATH} if POPPLER_PATH else {}
-        pages = convert_from_path(document_path, dpi=dpi, **poppler_arg)
-        return pages
+    for first, last in runs:
+        pages = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last, **poppler_arg)
+        for page_no, page in zip(range(first, last + 1), pages):
+            yield page_no, page
 
-    # Otherwise assume it is an image
-    return [Image.open(document_path).convert("RGB")]
+
+def iter_document_images(document_path, dpi=300, window=PDF_PAGE_WINDOW):
+    """
+    Yield document pages as PIL images, rasterizing `window` PDF pages at a time
+    so peak memory does not grow with the page count.
+    """
+    downloaded = is_remote_document(document_path)
+    document_path = resolve_document_path(document_path)
+    try:
+        # If PDF, convert to images using Poppler, a window of pages per call
+        if document_path.lower().endswith(".pdf"):
+            for _, page in iter_pdf_pages(document_path, dpi=dpi, window=window):
+                yield page
+            return
+
+        # Otherwise assume it is an image
+        yield Image.open(document_path).convert("RGB")
+    finally:
+        # don't leave downloaded documents behind in the temp dir
+        if downloaded:
+            os.remove(document_path)
+
+
+def render_pdf_page(pdf_path, page_no, dpi=300):
+    """
+    Rasterize a single (1-based) page of a local PDF.
+    """
+    poppler_arg = {"poppler_path": POPPLER_PATH} if POPPLER_PATH else {}
+    return convert_from_path(pdf_path, dpi=dpi, first_page=page_no, last_page=page_no, **poppler_arg)[0]
+
+
+_PAGE_RE = re.compile(r'<page\b[^>]*>(.*?)</page>', re.S)
+_WORD_RE = re.compile(
+    r'<word xMin="([\d.]+)" yMin="([\d.]+)" xMax="([\d.]+)" yMax="([\d.]+)">(.*?)</word>', re.S)
 
 
-def run_ocr_on_image(image):
+def _poppler_command(name):
+    if POPPLER_PATH and os.path.isdir(POPPLER_PATH):
+        return os.path.join(POPPLER_PATH, name)
+    return name
+
+
+def extract_pdf_text_layer(pdf_path, dpi=300, min_words=TEXT_LAYER_MIN_WORDS):
+    """
+    Read word boxes from the PDF's embedded text layer with `pdftotext -bbox`.
+    Returns {page_no: ocr_dict} in pytesseract image_to_data shape, with
+    coordinates scaled from PDF points to pixels at `dpi`. Pages with fewer than
+    min_words words (scans, image-only pages) are left out so they get OCR'd.
+    """
+    try:
+        proc = subprocess.run(
+            [_poppler_command("pdftotext"), "-bbox", pdf_path, "-"],
+            capture_output=True, timeout=120,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return {}
+    if proc.returncode != 0:
+        return {}
+
+    scale = dpi / 72.0
+    out = {}
+    xhtml = proc.stdout.decode("utf-8", errors="replace")
+    for page_no, page_match in enumerate(_PAGE_RE.finditer(xhtml), start=1):
+        words = _WORD_RE.findall(page_match.group(1))
+        if len(words) < min_words:
+            continue
+        ocr = {k: [] for k in ("level", "page_num", "left", "top", "width", "height", "conf", "text")}
+        for x_min, y_min, x_max, y_max, text in words:
+            left, top = float(x_min) * scale, float(y_min) * scale
+            ocr["level"].append(5)
+            ocr["page_num"].append(page_no)
+            ocr["left"].append(int(round(left)))
+            ocr["top"].append(int(round(top)))
+            ocr["width"].append(int(round(float(x_max) * scale - left)))
+            ocr["height"].append(int(round(float(y_max) * scale - top)))
+            ocr["conf"].append(100)
+            ocr["text"].append(html.unescape(text))
+        out[page_no] = ocr
+    return out
+
+
+def load_document_images(document_path, dpi=300):
+    return list(iter_document_images(document_path, dpi=dpi))
+
+
+# ------------------ OCR backends ------------------
+
+_OCR_DATA_KEYS = ("level", "page_num", "block_num", "par_num", "line_num", "word_num",
+                  "left", "top", "width", "height", "conf", "text")
+
+
+def _write_page(image, path_base):
+    """
+    Write a page where the tesseract CLI can read it and return the path.
+    In-memory pages are saved as uncompressed PNM (pytesseract would PNG-encode
+    them); the caller's image is left untouched.
+    """
+    if image.format is None and image.mode in ("1", "L", "RGB"):
+        path = path_base + ".pnm"
+        image.save(path, format="PPM")
+        return path
+    # same alpha handling / file format as pytesseract's own path
+    prepared, extension = pytesseract.pytesseract.prepare(image)
+    path = f"{path_base}.{extension.lower()}"
+    prepared.save(path, format=prepared.format)
+    return path
+
+
+class PytesseractBackend:
+    """
+    One `tesseract` subprocess per call (image passed through a temp file).
+    """
+    name = "pytesseract"
+    _version = None
+
+    @property
+    def version(self):
+        # part of the OCR cache key; `tesseract --version` runs once per backend
+        if self._version is None:
+            try:
+                self._version = str(pytesseract.get_tesseract_version())
+            except Exception:
+                return "unknown"
+        return self._version
+
+    def image_to_data(self, image, config=""):
+        # pytesseract now uses the correct tesseract_cmd path above
+        with tempfile.TemporaryDirectory(prefix="tess_") as tmp:
+            return pytesseract.image_to_data(_write_page(image, os.path.join(tmp, "page")), lang=OCR_LANG,
+                                             config=config, output_type=pytesseract.Output.DICT)
+
+    def images_to_data(self, images, config=""):
+        """
+        One `tesseract` process for several images: the page files are passed as
+        a list file and the TSV output is split back per image by page_num.
+        """
+        if len(images) == 1:
+            return [self.image_to_data(images[0], config=config)]
+        with tempfile.TemporaryDirectory(prefix="tess_batch_") as tmp:
+            paths = []
+            for i, image in enumerate(images):
+                paths.append(_write_page(image, os.path.join(tmp, f"page_{i:04d}")))
+            list_path = os.path.join(tmp, "pages.txt")
+            with open(list_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(paths) + "\n")
+            out_base = os.path.join(tmp, "out")
+            pytesseract.pytesseract.run_tesseract(
+                list_path, out_base, "tsv", OCR_LANG, f"-c tessedit_create_tsv=1 {config.strip()}"
+            )
+            with open(out_base + ".tsv", encoding="utf-8") as f:
+                tsv = f.read()
+        return split_tsv_pages(tsv, len(images))
+
+
+def split_tsv_pages(tsv, n_pages):
+    """
+    Split multi-page Tesseract TSV into one image_to_data-style dict per page.
+    page_num restarts at 1 in every dict, as for a single-image call.
+    """
+    data = pytesseract.pytesseract.file_to_dict(tsv, "\t", -1)
+    keys = list(data) or list(_OCR_DATA_KEYS)
+    pages = [{k: [] for k in keys} for _ in range(n_pages)]
+    for i, page_num in enumerate(data.get("page_num", [])):
+        page = pages[int(page_num) - 1]
+        for k in keys:
+            page[k].append(data[k][i])
+        page["page_num"][-1] = 1
+    return pages
+
+
+class TesserocrPoolBackend:
+    """
+    Pool of long-lived tesserocr engines: language data is loaded once per
+    engine and images are handed over in memory. Each call borrows one engine.
+    """
+    name = "tesserocr"
+
+    def __init__(self, pool_size=1, lang="eng"):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self.version = tesserocr.tesseract_version().split()[1]
+        self._engines = queue.LifoQueue()
+        for _ in range(max(1, pool_size)):
+            self._engines.put(tesserocr.PyTessBaseAPI(lang=lang))
+
+    def _apply_config(self, api, config):
+        """
+        Apply the pytesseract-style options we use (--psm N and -c name=value) to
+        a pooled engine. Returns the previous values of the variables it set, for
+        _restore_config: engine state outlives the call.
+        """
+        args = shlex.split(config or "")
+        api.SetPageSegMode(self._tesserocr.PSM.AUTO)
+        saved = {}
+        for i, arg in enumerate(args):
+            if arg == "--psm" and i + 1 < len(args):
+                api.SetPageSegMode(int(args[i + 1]))
+            elif arg == "-c" and i + 1 < len(args) and "=" in args[i + 1]:
+                name, value = args[i + 1].split("=", 1)
+                saved.setdefault(name, api.GetVariableAsString(name))
+                api.SetVariable(name, value)
+        return saved
+
+    @staticmethod
+    def _restore_config(api, saved):
+        for name, value in saved.items():
+            if value is not None:
+                api.SetVariable(name, value)
+
+    def image_to_data(self, image, config=""):
+        tesserocr = self._tesserocr
+        level = tesserocr.RIL.WORD
+        api = self._engines.get()
+        saved = {}
+        try:
+            saved = self._apply_config(api, config)
+            api.SetImage(image)
+            api.Recognize()
+            data = {k: [] for k in _OCR_DATA_KEYS}
+            word_num = 0
+            for word in tesserocr.iterate_level(api.GetIterator(), level):
+                box = word.BoundingBox(level)
+                if box is None:
+                    continue
+                x1, y1, x2, y2 = box
+                word_num += 1
+                data["level"].append(5)
+                data["page_num"].append(1)
+                data["block_num"].append(0)
+                data["par_num"].append(0)
+                data["line_num"].append(0)
+                data["word_num"].append(word_num)
+                data["left"].append(x1)
+                data["top"].append(y1)
+                data["width"].append(x2 - x1)
+                data["height"].append(y2 - y1)
+                data["conf"].append(word.Confidence(level))
+                data["text"].append(word.GetUTF8Text(level) or "")
+            api.Clear()
+            return data
+        finally:
+            self._restore_config(api, saved)
+            self._engines.put(api)
+
+    def images_to_data(self, images, config=""):
+        # engines are already warm: no per-call startup to amortize
+        return [self.image_to_data(image, config=config) for image in images]
+
+
+_backend = None
+_backend_pid = None
+
+
+def get_ocr_backend():
+    """
+    Process-wide OCR backend selected by OCR_BACKEND. Falls back to pytesseract
+    when the pooled backend cannot be created (e.g. tesserocr not installed).
+    """
+    global _backend, _backend_pid
+    # engines are not fork-safe: each worker process builds its own
+    if _backend is None or _backend_pid != os.getpid():
+        backend = None
+        if OCR_BACKEND == "tesserocr":
+            try:
+                backend = TesserocrPoolBackend(pool_size=OCR_POOL_SIZE, lang=OCR_LANG)
+            except Exception:
+                logger.warning("tesserocr backend unavailable, falling back to pytesseract", exc_info=True)
+        _backend = backend or PytesseractBackend()
+        _backend_pid = os.getpid()
+    return _backend
+
+
+def run_ocr_on_image(image, config="", dpi=None):
     """
     Run Tesseract OCR on a PIL Image and return word-level data.
+    Results are cached by page content, so resubmitted documents skip Tesseract.
+    """
+    backend = get_ocr_backend()
+    cache = get_ocr_cache()
+    key = None
+    if cache is not None:
+        key = ocr_cache_key(image, f"{backend.name}|{backend.version}|{OCR_LANG}|{config}", dpi)
+        cached = cache.get(key)
+        if cached is not None:
+            count("ocr_cache_hit")
+            return cached
+        count("ocr_cache_miss")
+
+    with span("ocr"):
+        data = backend.image_to_data(image, config=config)
+    if cache is not None:
+        cache.put(key, data)
+    return data
+
+
+def run_ocr_on_images(images, config="", dpi=None):
+    """
+    Batched run_ocr_on_image: pages missing from the OCR cache are OCR'd in a
+    single backend call (one tesseract process for the pytesseract backend).
+    Returns one word-level data dict per image, in order.
     """
+    backend = get_ocr_backend()
+    cache = get_ocr_cache()
+    results = [None] * len(images)
+    keys = [None] * len(images)
+    if cache is not None:
+        for i, image in enumerate(images):
+            keys[i] = ocr_cache_key(image, f"{backend.name}|{backend.version}|{OCR_LANG}|{config}", dpi)
+            results[i] = cache.get(keys[i])
+            count("ocr_cache_hit" if results[i] is not None else "ocr_cache_miss")
 
-    # pytesseract now uses the correct tesseract_cmd path above
-    return pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT) 
\ No newline at end of file
+    todo = [i for i, r in enumerate(results) if r is None]
+    if todo:
+        with span("ocr"):
+            batch = backend.images_to_data([images[i] for i in todo], config=config)
+        for i, data in zip(todo, batch):
+            results[i] = data
+            if cache is not None:
+                cache.put(keys[i], data)
+    return results
@@ -0,0 +1,165 @@
+# src/ocr_cache.py
+"""
+Content-addressed cache for Tesseract image_to_data results.
+Two layers: a per-process in-memory LRU in front of a SQLite file shared by all
+worker processes. Keys hash the rasterized page bytes plus DPI, OCR config
+(including the engine and its version) and CACHE_FORMAT_VERSION. The file's
+total size is kept in a one-row table by triggers, so eviction checks are O(1).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from src.config import OCR_CACHE_ENABLED, OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES, OCR_CACHE_MEMORY_ITEMS
+
+# bump when the stored OCR data changes shape; old entries then just age out
+CACHE_FORMAT_VERSION = 1
+
+
+def ocr_cache_key(image, config="", dpi=None):
+    if dpi is None:
+        dpi = image.info.get("dpi")
+    h = hashlib.sha256()
+    h.update(f"{CACHE_FORMAT_VERSION}|{image.mode}|{image.size}|{dpi}|{config}|".encode("utf-8"))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def _copy(data):
+    # OCR dicts hold lists of ints/strings: copying the lists is enough to keep
+    # callers from mutating a cached entry
+    return {k: list(v) for k, v in data.items()}
+
+
+class OCRCache:
+    def __init__(self, path, max_bytes, memory_items):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connection(self):
+        # connections must not be shared across fork(); reopen in each worker process
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                " key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_last_access ON ocr_cache(last_access)")
+            # running total of `size`; seeded once from existing rows
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("CREATE TABLE IF NOT EXISTS ocr_cache_size (id INTEGER PRIMARY KEY CHECK (id = 0),"
+                         " total INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO ocr_cache_size (id, total)"
+                         " SELECT 0, COALESCE(SUM(size), 0) FROM ocr_cache")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS ocr_cache_size_insert AFTER INSERT ON ocr_cache"
+                         " BEGIN UPDATE ocr_cache_size SET total = total + new.size; END")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS ocr_cache_size_update AFTER UPDATE OF size ON ocr_cache"
+                         " BEGIN UPDATE ocr_cache_size SET total = total + new.size - old.size; END")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS ocr_cache_size_delete AFTER DELETE ON ocr_cache"
+                         " BEGIN UPDATE ocr_cache_size SET total = total - old.size; END")
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key, data):
+        self._memory[key] = _copy(data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return _copy(self._memory[key])
+            conn = self._connection()
+            row = conn.execute("SELECT data FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE ocr_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            data = json.loads(zlib.decompress(row[0]))
+            self._remember(key, data)
+            self.hits_disk += 1
+            return data
+
+    def put(self, key, data):
+        blob = zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._remember(key, data)
+            conn = self._connection()
+            # an upsert, not INSERT OR REPLACE: REPLACE's implicit delete skips the size trigger
+            conn.execute(
+                "INSERT INTO ocr_cache (key, data, size, last_access) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET data = excluded.data, size = excluded.size,"
+                " last_access = excluded.last_access",
+                (key, blob, len(blob), time.time()),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT total FROM ocr_cache_size").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_access ASC"):
+            if excess <= 0:
+                break
+            victims.append((key,))
+            excess -= size
+        conn.executemany("DELETE FROM ocr_cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            entries = conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+            size = conn.execute("SELECT total FROM ocr_cache_size").fetchone()[0]
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": entries,
+                "disk_bytes": size,
+            }
+
+
+_cache = None
+
+
+def get_ocr_cache():
+    """
+    Return the process-wide OCR cache, or None when caching is disabled.
+    """
+    global _cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = OCRCache(OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES, OCR_CACHE_MEMORY_ITEMS)
+    return _cache
@@ -0,0 +1,79 @@
+# src/page_handoff.py
+"""
+Shared-memory page handoff between the rasterizing (API) process and pool workers.
+The parent copies a page bitmap into a SharedMemory block once; the worker maps
+the block as a NumPy array and wraps it as a PIL image without unpickling a copy.
+Only the small SharedPage descriptor crosses the process boundary.
+"""
+import contextlib
+import sys
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from PIL import Image
+
+# 8-bit modes PIL can wrap in place from a uint8 buffer; RGB pages are shared as L
+# (Tesseract binarizes anyway) and other modes are pickled as usual
+_SHAREABLE_MODES = ("L", "RGBA", "CMYK")
+
+
+@dataclass(slots=True)
+class SharedPage:
+    name: str
+    shape: tuple
+    mode: str
+
+
+def share_page(img):
+    """
+    Copy a PIL page into a new shared memory block. The caller must call
+    release_page() once the worker is done with it. RGB pages are converted to
+    grayscale first; pages in modes that can't be shared are returned unchanged.
+    """
+    if img.mode == "RGB":
+        img = img.convert("L")
+    if img.mode not in _SHAREABLE_MODES:
+        return img
+    arr = np.asarray(img)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, dtype=np.uint8, buffer=shm.buf)[...] = arr
+    page = SharedPage(shm.name, arr.shape, img.mode)
+    shm.close()
+    return page
+
+
+def release_page(page):
+    if not isinstance(page, SharedPage):
+        return
+    with contextlib.suppress(FileNotFoundError):
+        shm = shared_memory.SharedMemory(name=page.name)
+        shm.close()
+        shm.unlink()
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # the creating process owns the block; don't let this worker's tracker unlink it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+@contextlib.contextmanager
+def open_page(page):
+    """
+    Worker side: yield the shared page as a PIL image backed by the shared block.
+    The image must not be used after the block is closed.
+    """
+    shm = _attach(page.name)
+    try:
+        arr = np.ndarray(page.shape, dtype=np.uint8, buffer=shm.buf)
+        img = Image.frombuffer(page.mode, (page.shape[1], page.shape[0]), arr, "raw", page.mode, 0, 1)
+        yield img
+    finally:
+        img = arr = None
+        # a traceback may still reference the image; the mapping then goes away with it
+        with contextlib.suppress(BufferError):
+            shm.close()
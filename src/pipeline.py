@@ -0,0 +1,538 @@
+# src/pipeline.py
+"""
+Process-pool page pipeline shared by all API requests.
+OCR + line-item extraction run in worker processes so the event loop stays free.
+"""
+import asyncio
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from src.config import (
+    PAGE_WORKERS, MAX_PENDING_PAGES, PAGE_HANDOFF, OCR_BATCH_PAGES,
+    ADAPTIVE_DPI, ADAPTIVE_LOW_DPI, ADAPTIVE_HIGH_DPI, ADAPTIVE_MIN_CONF,
+    TEXT_LAYER_ENABLED, ROI_OCR, PREPROCESS_ENABLED, OCR_BACKEND, OCR_LANG,
+    EXTRACTOR_VERSION, RESULT_CACHE_ENABLED, RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+    NEAR_DUP_ENABLED, NEAR_DUP_MAX_DISTANCE, NEAR_DUP_HASH_SIZE, NEAR_DUP_DPI, NEAR_DUP_VERIFY_DPI,
+    NEAR_DUP_MAX_DOCUMENTS,
+)
+from src.lineitem_extractor import extract_pagewise_line_items, page_needs_rescan
+from src.ocr import (
+    extract_pdf_text_layer, iter_document_images, iter_pdf_pages, pdf_page_count,
+    render_pdf_page, run_ocr_on_images,
+)
+from src.preprocess import deskew_and_binarize
+from src.fetch import open_document
+from src.near_duplicates import (
+    NearDuplicateIndex, document_hashes, replay_data, verification_digest, verify_near_duplicate,
+)
+from src.page_handoff import SharedPage, open_page, release_page, share_page
+from src import metrics
+from src.reconciler import Reconciler, reconcile_lines, reconcile_totals
+from src.result_cache import MISS, NEAR_DUPLICATE, ResultCache, document_cache_key
+
+_executor = None
+_page_slots = None
+_result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+_near_dup_index = NearDuplicateIndex(NEAR_DUP_MAX_DISTANCE, NEAR_DUP_MAX_DOCUMENTS)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PAGE_WORKERS, initializer=metrics.set_worker_mode)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def _get_page_slots():
+    # bounded queue: at most MAX_PENDING_PAGES pages rendered or in the pool at once
+    global _page_slots
+    if _page_slots is None:
+        _page_slots = asyncio.Semaphore(MAX_PENDING_PAGES)
+    return _page_slots
+
+
+def _run_with_metrics(fn, *args):
+    # worker side: ship the page's buffered stage timings/counters back with its result
+    result = fn(*args)
+    return result, metrics.drain()
+
+
+async def _collect_metrics(fut):
+    result, snapshot = await fut
+    metrics.merge(snapshot)
+    return result
+
+
+def _release_slots(slots, n):
+    for _ in range(n):
+        slots.release()
+
+
+def _submit_page(slots, fn, *args, held=1):
+    # caller has already acquired `held` slots; they are released when the pool future settles
+    try:
+        fut = asyncio.get_running_loop().run_in_executor(get_executor(), _run_with_metrics, fn, *args)
+    except BaseException:
+        _release_slots(slots, held)
+        raise
+    fut.add_done_callback(lambda _: _release_slots(slots, held))
+    return asyncio.ensure_future(_collect_metrics(fut))
+
+
+def _handoff(img):
+    # with PAGE_HANDOFF=shm the worker maps the page instead of unpickling a copy
+    if img is None or PAGE_HANDOFF != "shm":
+        return img
+    return share_page(img)
+
+
+def _next_page(rendered):
+    # rasterizer thread: the grayscale copy into shared memory happens here too,
+    # so neither step runs on the event loop
+    _, img = next(rendered)
+    return _handoff(img)
+
+
+async def _render_next(rendered):
+    fut = asyncio.ensure_future(asyncio.to_thread(_next_page, rendered))
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        # the thread can't be stopped; free its page once it finishes
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception() or release_page(f.result()))
+        raise
+
+
+def _submit_handoff(slots, fn, pages, *args):
+    # _submit_page for page jobs holding one slot per entry of `pages` (images,
+    # or SharedPages from _next_page); shared pages are freed once the job settles
+    try:
+        fut = _submit_page(slots, fn, pages, *args, held=len(pages))
+    except BaseException:
+        for page in pages:
+            release_page(page)
+        raise
+    fut.add_done_callback(lambda _: [release_page(page) for page in pages])
+    return fut
+
+
+def _submit_handoff_page(slots, img, *args):
+    return _submit_handoff(slots, _process_shared_page, [img], *args)
+
+
+def _submit_handoff_batch(slots, imgs, *args):
+    return _submit_handoff(slots, process_pages, imgs, *args)
+
+
+def _process_shared_page(imgs, *args):
+    return process_page(imgs[0], *args)
+
+
+def _compact(result, include_lines):
+    # only items (and the few lines reconciliation reads) go back over the pipe
+    if not include_lines:
+        result.pop("lines", None)
+        result["ocr_lines"] = reconcile_lines(result.get("ocr_lines", []))
+    return result
+
+
+def process_page(img, page_no, conservative_min_conf=40, dpi=300, pdf_path=None, ocr=None, include_lines=False):
+    """
+    Worker-side page job. Pages from the PDF text layer arrive as `ocr` with no
+    image. With adaptive DPI, a page rendered below ADAPTIVE_HIGH_DPI is
+    re-rendered from the PDF and redone at high DPI when the low-resolution
+    pass looks unreliable. `img` may be a SharedPage (see src.page_handoff).
+    Word-level lines are only kept in the result with include_lines.
+    """
+    if isinstance(img, SharedPage):
+        with open_page(img) as page_img:
+            return process_page(page_img, page_no, conservative_min_conf, dpi, pdf_path, ocr, include_lines)
+    text_layer = ocr is not None
+    metrics.count("pages_text_layer" if text_layer else "pages_ocr")
+    result = extract_pagewise_line_items(img, page_no, conservative_min_conf, dpi=dpi, ocr=ocr)
+    del img
+    if not text_layer:
+        result = _rescan_if_needed(result, page_no, conservative_min_conf, dpi, pdf_path)
+    metrics.count("items", len(result["bill_items"]))
+    return _compact(result, include_lines)
+
+
+def _rescan_if_needed(result, page_no, conservative_min_conf, dpi, pdf_path):
+    if ADAPTIVE_DPI and pdf_path and dpi < ADAPTIVE_HIGH_DPI and page_needs_rescan(result, ADAPTIVE_MIN_CONF):
+        metrics.count("pages_rescanned")
+        with metrics.span("rasterize"):
+            hi_res = render_pdf_page(pdf_path, int(page_no), dpi=ADAPTIVE_HIGH_DPI)
+        result = extract_pagewise_line_items(hi_res, page_no, conservative_min_conf, dpi=ADAPTIVE_HIGH_DPI)
+    return result
+
+
+def process_pages(imgs, page_nos, conservative_min_conf=40, dpi=300, pdf_path=None, include_lines=False):
+    """
+    Worker-side job for a chunk of rendered pages: the chunk is OCR'd with one
+    batched Tesseract call (run_ocr_on_images), then each page is extracted
+    (and rescanned at high DPI if needed) as in process_page.
+    Returns a list of page results.
+    """
+    with contextlib.ExitStack() as stack:
+        imgs = [stack.enter_context(open_page(img)) if isinstance(img, SharedPage) else img for img in imgs]
+        if PREPROCESS_ENABLED:
+            with metrics.span("preprocess"):
+                imgs = [deskew_and_binarize(img) for img in imgs]
+        ocrs = run_ocr_on_images(imgs, dpi=dpi)
+    del imgs
+
+    results = []
+    for page_no, ocr in zip(page_nos, ocrs):
+        metrics.count("pages_ocr")
+        result = extract_pagewise_line_items(None, page_no, conservative_min_conf, dpi=dpi, ocr=ocr)
+        result = _rescan_if_needed(result, page_no, conservative_min_conf, dpi, pdf_path)
+        metrics.count("items", len(result["bill_items"]))
+        results.append(_compact(result, include_lines))
+    return results
+
+
+_END = object()
+
+
+@dataclass(slots=True)
+class DocumentPlan:
+    """
+    How a document's pages are produced, shared by the API's pool producer and
+    the offline batch path: text-layer pages are ready-made OCR data, the rest
+    come from `rendered` as (page_no, image) and are OCR'd `batch_size` at a time.
+    """
+    pdf_path: str
+    page_dpi: int
+    page_count: int
+    text_pages: dict
+    rendered: object
+    batch_size: int
+
+
+def plan_document(path, dpi=None):
+    """
+    Blocking: read the text layer and page count of a local document and set up
+    its rasterizer. PDFs are rendered at ADAPTIVE_LOW_DPI when adaptive DPI is
+    on (see process_page). The caller must close plan.rendered.
+    """
+    if dpi is None:
+        dpi = ADAPTIVE_LOW_DPI if ADAPTIVE_DPI else ADAPTIVE_HIGH_DPI
+    pdf_path = path if path.lower().endswith(".pdf") else None
+    # image inputs are not re-rendered; treat them as reference-resolution scans
+    page_dpi = dpi if pdf_path else ADAPTIVE_HIGH_DPI
+
+    # digital PDF pages come straight from the text layer; only the rest are rendered
+    text_pages = {}
+    if pdf_path:
+        if TEXT_LAYER_ENABLED:
+            with metrics.span("text_layer"):
+                text_pages = extract_pdf_text_layer(pdf_path, page_dpi)
+        page_count = pdf_page_count(pdf_path)
+        ocr_pages = [n for n in range(1, page_count + 1) if n not in text_pages]
+        rendered = iter_pdf_pages(pdf_path, ocr_pages, dpi=dpi)
+    else:
+        page_count = 1
+        rendered = ((1, img) for img in iter_document_images(path, dpi=dpi))
+
+    # ROI OCR crops each page differently, so it is not batched; a chunk holds
+    # one slot per page and must fit in the page budget
+    batch_size = 1 if ROI_OCR else max(1, min(OCR_BATCH_PAGES, MAX_PENDING_PAGES))
+    return DocumentPlan(pdf_path, page_dpi, page_count, text_pages, rendered, batch_size)
+
+
+def extract_document_sync(path, conservative_min_conf=40, dpi=None, include_lines=False):
+    """
+    extract_document in the calling process (no pool, no slots), for callers
+    that already run one document per process. Same page plan and settings.
+    """
+    plan = plan_document(path, dpi)
+    args = (conservative_min_conf, plan.page_dpi, plan.pdf_path)
+    results = []
+    batch = []
+    try:
+        for page_no in range(1, plan.page_count + 1):
+            if page_no in plan.text_pages:
+                ocr = plan.text_pages.pop(page_no)
+                results.append(process_page(None, str(page_no), *args, ocr, include_lines))
+                continue
+            with metrics.span("rasterize"):
+                _, img = next(plan.rendered)
+            if plan.batch_size == 1:
+                results.append(process_page(img, str(page_no), *args, None, include_lines))
+                continue
+            batch.append((img, str(page_no)))
+            if len(batch) >= plan.batch_size:
+                results.extend(process_pages([b[0] for b in batch], [b[1] for b in batch], *args, include_lines))
+                batch.clear()
+        if batch:
+            results.extend(process_pages([b[0] for b in batch], [b[1] for b in batch], *args, include_lines))
+    finally:
+        plan.rendered.close()
+    return sorted(results, key=lambda r: int(r["page_no"]))
+
+
+async def _submit_document_pages(path, conservative_min_conf, dpi, tasks, done, include_lines=False):
+    """
+    Producer: stream a document page by page into the pool. Each page is
+    submitted as soon as it is rasterized (or, with OCR_BATCH_PAGES > 1, once
+    a chunk of that many rendered pages is ready, or earlier when the page
+    budget runs out), and the next page is only rendered once a slot is free.
+    Finished futures (one page result, or a list for a chunk) are put on
+    `done`, followed by _END once everything is submitted.
+    """
+    plan = await asyncio.to_thread(plan_document, path, dpi)
+    pdf_path, page_dpi, text_pages, rendered = plan.pdf_path, plan.page_dpi, plan.text_pages, plan.rendered
+    batch_size = plan.batch_size
+    batch = []
+
+    def submit_batch():
+        imgs, page_nos = [img for img, _ in batch], [n for _, n in batch]
+        batch.clear()
+        fut = _submit_handoff_batch(slots, imgs, page_nos, conservative_min_conf, page_dpi, pdf_path, include_lines)
+        fut.add_done_callback(done.put_nowait)
+        tasks.append(fut)
+
+    slots = _get_page_slots()
+    try:
+        for page_no in range(1, plan.page_count + 1):
+            if batch and slots.locked():
+                # never wait for a slot while holding a partial chunk's slots:
+                # concurrent documents could each hold one and starve each other
+                submit_batch()
+            await slots.acquire()
+            try:
+                if page_no in text_pages:
+                    img, ocr = None, text_pages.pop(page_no)
+                else:
+                    with metrics.span("rasterize"):
+                        img = await _render_next(rendered)
+                    ocr = None
+            except BaseException:
+                slots.release()
+                raise
+            if ocr is None and batch_size > 1:
+                batch.append((img, str(page_no)))
+                if len(batch) >= batch_size:
+                    submit_batch()
+            else:
+                fut = _submit_handoff_page(slots, img, str(page_no), conservative_min_conf,
+                                           page_dpi, pdf_path, ocr, include_lines)
+                fut.add_done_callback(done.put_nowait)
+                tasks.append(fut)
+            del img, ocr
+        if batch:
+            submit_batch()
+        done.put_nowait(_END)
+    finally:
+        # pages rendered into an unsubmitted chunk still hold their slots
+        _release_slots(slots, len(batch))
+        for img, _ in batch:
+            release_page(img)
+        try:
+            rendered.close()
+        except ValueError:
+            # still running in a rasterizer thread after cancellation
+            pass
+
+
+async def iter_page_results(document_path, conservative_min_conf=40, dpi=None, include_lines=False):
+    """
+    Yield page results as soon as each page finishes (completion order, not
+    page order). Pages are planned by plan_document.
+    """
+    async with open_document(document_path) as path:
+        tasks = []
+        done = asyncio.Queue()
+        producer = asyncio.ensure_future(_submit_document_pages(path, conservative_min_conf, dpi, tasks, done,
+                                                                include_lines))
+        producer.add_done_callback(lambda f: f.cancelled() or f.exception() is None or done.put_nowait(f))
+        try:
+            total = None
+            finished = 0
+            while total is None or finished < total:
+                fut = await done.get()
+                if fut is _END:
+                    total = len(tasks)
+                    continue
+                # a page failure (or a producer failure) is raised here
+                result = fut.result()
+                finished += 1
+                if isinstance(result, list):
+                    for page in result:
+                        yield page
+                else:
+                    yield result
+        finally:
+            producer.cancel()
+            for t in tasks:
+                t.cancel()
+            # let the producer unwind (and close the rasterizer) before the file goes away
+            await asyncio.gather(producer, return_exceptions=True)
+
+
+async def extract_document(document_path, conservative_min_conf=40, dpi=None, include_lines=False):
+    """
+    Extract every page of a document on the shared pool.
+    Returns page results ordered by page_no.
+    """
+    results = [r async for r in iter_page_results(document_path, conservative_min_conf, dpi, include_lines)]
+    return sorted(results, key=lambda r: int(r["page_no"]))
+
+
+def build_bill_data(pagewise_results, reconciler=None):
+    """
+    Assemble the extract_bill() data payload from page results (any order).
+    """
+    pagewise_results = sorted(pagewise_results, key=lambda r: int(r["page_no"]))
+    total_items = sum(len(p["bill_items"]) for p in pagewise_results)
+
+    # Reconcile totals from all pages (printed total comes from the OCR lines
+    # already produced by extraction, then those lines are dropped from the payload).
+    # A reconciler already fed page by page (streaming) only has to finish up.
+    with metrics.span("reconcile"):
+        totals = reconciler.result() if reconciler is not None else reconcile_totals(pagewise_results)
+    for page in pagewise_results:
+        page.pop("ocr_lines", None)
+
+    return {
+        "pagewise_line_items": pagewise_results,
+        "total_item_count": total_items,
+        **totals
+    }
+
+
+async def extract_bill(document_path, conservative_min_conf=40, include_lines=False):
+    """
+    Full document extraction: pagewise items, item count and reconciled totals.
+    Returns the "data" payload of the API response, still holding BillItem/Line
+    records (see records.bill_to_dict).
+    """
+    pages = await extract_document(document_path, conservative_min_conf, include_lines=include_lines)
+    return build_bill_data(pages)
+
+
+def _extraction_params(conservative_min_conf, include_lines=False):
+    # everything besides the document bytes that changes the extraction result
+    return {
+        "version": EXTRACTOR_VERSION,
+        "conservative_min_conf": conservative_min_conf,
+        "include_lines": include_lines,
+        "adaptive_dpi": (ADAPTIVE_DPI, ADAPTIVE_LOW_DPI, ADAPTIVE_HIGH_DPI, ADAPTIVE_MIN_CONF),
+        "text_layer": TEXT_LAYER_ENABLED,
+        "roi_ocr": ROI_OCR,
+        "preprocess": PREPROCESS_ENABLED,
+        "ocr": (OCR_BACKEND, OCR_LANG),
+        # shm pages are OCR'd in grayscale
+        "page_handoff": PAGE_HANDOFF,
+    }
+
+
+async def _near_duplicate_lookup(path, params):
+    """
+    Hash the pages of a document at low resolution and look for an earlier
+    extraction of a near-identical one. A match is only returned once a
+    low-resolution OCR of this document, run on the page pool like any other
+    page job, agrees with the stored items and printed total.
+    Returns (page hashes, data or None).
+    """
+    with metrics.span("near_dup_hash"):
+        hashes = await asyncio.to_thread(document_hashes, path, NEAR_DUP_DPI, NEAR_DUP_HASH_SIZE)
+    data = _near_dup_index.find(hashes, params)
+    if data is not None:
+        slots = _get_page_slots()
+        with metrics.span("near_dup_verify"):
+            await slots.acquire()
+            same = await _submit_page(slots, verify_near_duplicate, path, verification_digest(data),
+                                      NEAR_DUP_VERIFY_DPI)
+        if not same:
+            metrics.count("near_duplicate_rejected")
+            data = None
+    metrics.count("near_duplicate_hit" if data is not None else "near_duplicate_miss")
+    return hashes, data
+
+
+def _remember_near_duplicate(hashes, params, data):
+    # only results with a printed total can ever be verified against a candidate
+    if hashes and data.get("printed_total") is not None:
+        _near_dup_index.add(hashes, params, replay_data(data))
+
+
+async def extract_bill_cached(document_path, conservative_min_conf=40, include_lines=False):
+    """
+    extract_bill behind the request-level result cache and, when enabled, the
+    near-duplicate index. Returns (data, cache_status) with cache_status HIT,
+    MISS, COALESCED or NEAR_DUPLICATE. A near-duplicate's result is never
+    stored under this document's key, so it is re-verified on every request.
+    """
+    async with open_document(document_path) as path:
+        params = _extraction_params(conservative_min_conf, include_lines)
+        reused = []
+
+        async def compute():
+            # reused results carry no OCR lines: requests asking for lines always extract
+            if not NEAR_DUP_ENABLED or include_lines:
+                return await extract_bill(path, conservative_min_conf, include_lines)
+            hashes, data = await _near_duplicate_lookup(path, params)
+            if data is not None:
+                reused.append(data)
+                return data
+            data = await extract_bill(path, conservative_min_conf, include_lines)
+            _remember_near_duplicate(hashes, params, data)
+            return data
+
+        if not RESULT_CACHE_ENABLED:
+            data, status = await compute(), MISS
+        else:
+            key = await asyncio.to_thread(document_cache_key, path, params)
+            data, status = await _result_cache.get_or_compute(key, compute, store=lambda value: not reused)
+            metrics.count(f"result_cache_{status.lower()}")
+        if reused:
+            status = NEAR_DUPLICATE
+        return data, status
+
+
+async def iter_bill(document_path, conservative_min_conf=40, include_lines=False):
+    """
+    Streaming variant of extract_bill_cached. Yields (page, running_totals) as
+    soon as each page is ready, where running_totals is the Reconciler state
+    after that page, then (None, data) with the complete extract_bill() data.
+    A cached (or near-duplicate) document is replayed from the stored result.
+    """
+    async with open_document(document_path) as path:
+        reconciler = Reconciler()
+        params = _extraction_params(conservative_min_conf, include_lines)
+        key = None
+        cached = None
+        if RESULT_CACHE_ENABLED:
+            key = await asyncio.to_thread(document_cache_key, path, params)
+            cached = _result_cache.get(key)
+            metrics.count("result_cache_hit" if cached is not None else "result_cache_miss")
+        hashes = None
+        if cached is None and NEAR_DUP_ENABLED and not include_lines:
+            hashes, cached = await _near_duplicate_lookup(path, params)
+        if cached is not None:
+            for page in cached["pagewise_line_items"]:
+                yield page, reconciler.add_page(page)
+            yield None, cached
+            return
+
+        pages = []
+        async for page in iter_page_results(path, conservative_min_conf, include_lines=include_lines):
+            pages.append(page)
+            with metrics.span("reconcile"):
+                running = reconciler.add_page(page)
+            yield page, running
+        data = build_bill_data(pages, reconciler)
+        if key is not None:
+            _result_cache.put(key, data)
+        if hashes is not None:
+            _remember_near_duplicate(hashes, params, data)
+        yield None, data
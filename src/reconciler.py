@@ -3,66 +3,161 @@ from decimal import Decimal
 import re
 from collections import defaultdict
 from src.ocr import run_ocr_on_image
+from src.records import Line
 from src.table_detector import extract_rows_from_ocr
 
-def normalize_name(n):
-    return "".join(ch for ch in n.lower() if ch.isalnum() or ch.isspace()).strip()
+# running balances printed at page breaks: never items, never the printed bill total
+CARRY_FORWARD_RE = re.compile(r"\b(?:carried|brought|balance)\s+(?:forward|fwd|over)\b|\b[bc]\s*/\s*[fo]\b", re.I)
+# per-page / partial sums: never items, never the printed bill total
+SUBTOTAL_RE = re.compile(r"\bsub\s*-?\s*total\b|\bpage\s+total\b", re.I)
+# lines this close to the top of a page are compared across pages to find repeated table headers
+HEADER_SCAN_LINES = 6
+_TOTAL_RE = re.compile(r"total|amount")
+# a whole money token: thousands separators plus optional decimals ("21,800.00")
+_MONEY_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
 
-def dedupe_items(items):
-    seen = {}
-    unique = []
-    for it in items:
-        key = (normalize_name(it.get("item_name","")), round(float(it.get("item_amount",0.0)),2))
-        if key in seen:
-            continue
-        seen[key] = True
-        unique.append(it)
-    return unique
+def _total_candidate(txt):
+    low = txt.lower()
+    # running balances and per-page sums are not the bill total
+    if _TOTAL_RE.search(low) and not CARRY_FORWARD_RE.search(low) and not SUBTOTAL_RE.search(low):
+        nums = [n.replace(",", "") for n in _MONEY_RE.findall(txt)]
+        if nums:
+            return float(nums[-1])
+    return None
+
+def reconcile_lines(lines):
+    """
+    The OCR lines Reconciler reads from a page (top-of-page lines and printed
+    total candidates), without word boxes. Page results carry only these back
+    from the pool unless the request asked for lines.
+    """
+    return [
+        Line(ln.text, ln.avg_conf, ln.min_left, ln.max_right)
+        for i, ln in enumerate(lines)
+        if i < HEADER_SCAN_LINES or _total_candidate(ln.text) is not None
+    ]
+
+def find_printed_total_in_lines(lines):
+    """
+    Scan OCR lines for candidate printed totals.
+    Return the last candidate as float, or None.
+    """
+    candidates = [c for c in (_total_candidate(ln.text) for ln in lines) if c is not None]
+    if not candidates:
+        return None
+    return float(candidates[-1])
 
 def find_printed_total_on_pages(pages):
     """
     Given PIL image pages, run OCR text scan to find candidate printed totals.
     Return float or None.
     """
-    candidates = []
+    all_lines = []
     for p in pages:
         try:
             ocr = run_ocr_on_image(p)
-            lines = extract_rows_from_ocr(ocr, min_confidence=10)
-            for ln in lines:
-                txt = ln.get("text","")
-                low = txt.lower()
-                if "total" in low or "amount" in low or "grand total" in low:
-                    nums = re.findall(r"\d+[.,]?\d*", txt)
-                    if nums:
-                        candidates.append(float(nums[-1].replace(",","")))
+            all_lines.extend(extract_rows_from_ocr(ocr, min_confidence=10, with_words=False))
         except Exception:
             # if OCR of a page fails, skip that page
             continue
-    if not candidates:
-        return None
-    return float(candidates[-1])
+    return find_printed_total_in_lines(all_lines)
 
-def reconcile_totals(page_items, pages=None):
+def _header_key(text):
+    return "".join(ch for ch in text.lower() if ch.isalpha())
+
+class Reconciler:
     """
-    page_items: list of page dicts (each has 'bill_items' and optionally 'lines')
-    pages: optional list of PIL pages (for printed total search)
-    Returns dict with reconciled_amount and optional printed_total / note.
+    Incremental cross-page reconciliation. Pages can be added in any order
+    (e.g. as they stream in); each add is O(items + lines) on that page.
+      - one hash index of item_key -> item dedupes items across pages
+      - carry-forward / subtotal rows are excluded from the sum
+      - rows repeated at the top of several pages are treated as table headers
+        and ignored when looking for the printed total
+    running_totals() is available at any time; result() gives the final totals.
     """
-    all_items = []
-    for page in page_items:
-        all_items.extend(page.get("bill_items", []))
+    def __init__(self):
+        self._index = {}
+        self._total = Decimal(0)
+        self._pages = 0
+        self._skipped = 0
+        self._header_pages = defaultdict(set)   # header key -> page numbers it tops
+        self._candidates = {}                   # page_no -> [(header key, printed total candidate)]
+        self._have_lines = False
+
+    def add_page(self, page):
+        """
+        page: page dict with 'bill_items' and optionally 'ocr_lines'.
+        Returns running_totals().
+        """
+        self._pages += 1
+        for it in page.get("bill_items", []):
+            if CARRY_FORWARD_RE.search(it.item_name) or SUBTOTAL_RE.search(it.item_name):
+                self._skipped += 1
+                continue
+            key = it.key()
+            if key in self._index:
+                continue
+            self._index[key] = it
+            self._total += Decimal(str(key[1]))
+
+        page_no = int(page.get("page_no", self._pages))
+        lines = page.get("ocr_lines", [])
+        self._have_lines = self._have_lines or bool(lines)
+        for ln in lines[:HEADER_SCAN_LINES]:
+            hk = _header_key(ln.text)
+            if hk:
+                self._header_pages[hk].add(page_no)
+        candidates = []
+        for ln in lines:
+            value = _total_candidate(ln.text)
+            if value is not None:
+                candidates.append((_header_key(ln.text), value))
+        if candidates:
+            self._candidates[page_no] = candidates
+        return self.running_totals()
+
+    def items(self):
+        return list(self._index.values())
+
+    def running_totals(self):
+        return {
+            "reconciled_amount": float(self._total),
+            "unique_item_count": len(self._index),
+            "pages_reconciled": self._pages,
+        }
 
-    unique = dedupe_items(all_items)
-    total_sum = sum(float(i.get("item_amount",0.0)) for i in unique)
-    result = {"reconciled_amount": float(Decimal(str(total_sum)))}
+    def printed_total(self):
+        # last candidate in page order, skipping headers repeated across pages
+        for page_no in sorted(self._candidates, reverse=True):
+            for hk, value in reversed(self._candidates[page_no]):
+                if len(self._header_pages.get(hk, ())) < 2:
+                    return value
+        return None
 
-    printed = None
-    if pages:
-        printed = find_printed_total_on_pages(pages)
+    def result(self, pages=None):
+        """
+        Final totals in the reconcile_totals() format. `pages` (PIL images) is
+        only used to OCR for the printed total when no page carried ocr_lines.
+        """
+        result = {"reconciled_amount": float(self._total)}
+        printed = self.printed_total()
+        if not self._have_lines and pages:
+            printed = find_printed_total_on_pages(pages)
         if printed is not None:
             result["printed_total"] = float(printed)
             diff = abs(printed - result["reconciled_amount"])
             if diff > max(1.0, 0.01 * (printed if printed else 0.0)):
                 result["note"] = f"printed_total_mismatch (printed={printed},extracted={result['reconciled_amount']})"
-    return result 
\ No newline at end of file
+        return result
+
+def reconcile_totals(page_items, pages=None):
+    """
+    page_items: list of page dicts (each has 'bill_items' BillItem records and optionally 'ocr_lines')
+    pages: optional list of PIL pages; only needed when page_items carry no 'ocr_lines'
+           (the printed total is otherwise found from the lines already OCR'd)
+    Returns dict with reconciled_amount and optional printed_total / note.
+    """
+    reconciler = Reconciler()
+    for page in page_items:
+        reconciler.add_page(page)
+    return reconciler.result(pages)
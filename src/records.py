@@ -0,0 +1,99 @@
+# src/records.py
+"""
+Compact __slots__ records used through the extraction pipeline.
+They are converted to plain dicts only when building the API response.
+"""
+from dataclasses import dataclass, field
+import re
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+
+
+def item_key(name, amount):
+    """
+    Canonical dedupe key for a bill item, shared by the page extractor and the
+    cross-page reconciler: lowercase alphanumeric name + amount rounded to cents.
+    """
+    return _NON_ALNUM_RE.sub("", name.lower()), round(float(amount), 2)
+
+
+@dataclass(slots=True)
+class Word:
+    text: str
+    left: int
+    right: int
+    top: int
+    conf: int
+
+    def to_dict(self):
+        return {"text": self.text, "left": self.left, "right": self.right, "top": self.top, "conf": self.conf}
+
+
+@dataclass(slots=True)
+class Line:
+    text: str
+    avg_conf: int
+    min_left: int
+    max_right: int
+    words: list = field(default_factory=list)
+    tags: dict = None   # cached classify_line() result, never serialized
+
+    def to_dict(self):
+        return {
+            "text": self.text,
+            "avg_conf": self.avg_conf,
+            "min_left": self.min_left,
+            "max_right": self.max_right,
+            "words": [w.to_dict() for w in self.words],
+        }
+
+
+@dataclass(slots=True)
+class BillItem:
+    item_name: str
+    item_quantity: float
+    item_rate: float
+    item_amount: float
+    confidence: int = -1
+    origin: str = "visual"
+
+    def key(self):
+        return item_key(self.item_name, self.item_amount)
+
+    def to_dict(self):
+        return {
+            "item_name": self.item_name,
+            "item_quantity": self.item_quantity,
+            "item_rate": self.item_rate,
+            "item_amount": self.item_amount,
+            "confidence": self.confidence,
+            "origin": self.origin,
+        }
+
+
+def page_to_dict(page, include_lines=False, item_fields=None):
+    """
+    JSON-ready copy of a page result: records become dicts, internal keys
+    (ocr_lines) are dropped. OCR lines are only included when asked for, and
+    item_fields (if given) limits each bill item to those keys.
+    """
+    out = {k: v for k, v in page.items() if k not in ("bill_items", "lines", "ocr_lines")}
+    items = [it.to_dict() for it in page.get("bill_items", [])]
+    if item_fields:
+        items = [{k: it[k] for k in item_fields if k in it} for it in items]
+    out["bill_items"] = items
+    if include_lines and "lines" in page:
+        out["lines"] = [ln.to_dict() for ln in page["lines"]]
+    return out
+
+
+def bill_to_dict(data, include_lines=False, item_fields=None):
+    """
+    JSON-ready copy of an extract_bill() result.
+    """
+    out = dict(data)
+    out["pagewise_line_items"] = [
+        page_to_dict(p, include_lines=include_lines, item_fields=item_fields)
+        for p in data["pagewise_line_items"]
+    ]
+    return out
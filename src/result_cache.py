@@ -0,0 +1,94 @@
+# src/result_cache.py
+"""
+Request-level result cache for whole-document extractions.
+TTL + LRU in memory, with single-flight coalescing: concurrent requests for the
+same key wait on one computation instead of each running the full pipeline.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+HIT = "HIT"
+MISS = "MISS"
+COALESCED = "COALESCED"
+# not produced by ResultCache: a near-duplicate document's result was reused (see near_duplicates.py)
+NEAR_DUPLICATE = "NEAR_DUPLICATE"
+
+# handed to waiters when the computing request was cancelled; one of them takes over
+_ABANDONED = object()
+
+
+def document_cache_key(path, params):
+    """
+    sha256 of the document bytes plus the extraction parameters that affect the result.
+    """
+    h = hashlib.sha256()
+    h.update(repr(sorted(params.items())).encode("utf-8"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key, compute, store=None):
+        """
+        Return (value, status) where status is HIT, MISS or COALESCED.
+        compute: zero-argument coroutine function run at most once per key at a time.
+        If the computing caller is cancelled, a waiting caller runs its own compute.
+        store: optional predicate; a computed value it rejects is handed to the
+        waiting callers but not cached.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value, HIT
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            value = await asyncio.shield(inflight)
+            if value is not _ABANDONED:
+                return value, COALESCED
+
+        fut = asyncio.get_running_loop().create_future()
+        # errors are re-raised to the leader; don't warn when nobody else waited
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = fut
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            fut.set_result(_ABANDONED)
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        if store is None or store(value):
+            self.put(key, value)
+        fut.set_result(value)
+        return value, MISS
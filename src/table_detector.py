@@ -1,62 +1,313 @@
 # src/table_detector.py
+from dataclasses import dataclass, field
+import bisect
+import re
+from src.config import ROI_FOOTER_SCALE
+from src.metrics import span
 from src.ocr import run_ocr_on_image
+from src.preprocess import ink_mask, pil_to_gray
+from src.records import Line, Word
+import cv2
 import numpy as np
 
-def extract_rows_from_ocr(ocr, min_confidence=40):
+LINE_TOP_TOLERANCE = 10
+
+ROI_ANALYSIS_WIDTH = 1000   # table detection runs on a copy downscaled to this width
+ROI_MIN_HEIGHT = 0.15       # detected table must cover at least this fraction of the page
+ROI_PADDING = 0.01          # extra page height kept above/below the detected table
+
+# numeric column detection; pixel values are for 300 DPI pages and are scaled by the caller
+COLUMN_BIN_WIDTH = 4        # histogram bin width
+COLUMN_MIN_GAP = 24         # empty span that separates two columns
+COLUMN_TOLERANCE = 12       # slack when looking up which column a word falls in
+COLUMN_MIN_SUPPORT = 0.2    # fraction of numeric lines a column must appear on (at least 2 lines)
+COLUMN_ROLES = ("amount", "rate", "qty")   # assigned right to left
+COLUMN_SMALL_INT_RE = re.compile(r"\d{1,2}")   # serial numbers / quantities, never money
+COLUMN_LEADING_SUPPORT = 0.5  # share of a column's lines with item text to its right that marks an index column
+
+NUMERIC_WORD_RE = re.compile(r"[₹$€£]?\d[\d,]*(?:\.\d{1,2})?")
+
+
+def _conf_array(values, n):
+    try:
+        return np.asarray(values, dtype=float).astype(np.int64)
+    except (TypeError, ValueError):
+        out = np.full(n, -1, dtype=np.int64)
+        for i, v in enumerate(values):
+            try:
+                out[i] = int(float(v))
+            except:
+                pass
+        return out
+
+
+def extract_row_arrays(ocr, min_confidence=40, line_tolerance=LINE_TOP_TOLERANCE):
+    """
+    Columnar word filtering + line grouping over Tesseract's image_to_data dict.
+    Returns (texts, conf, left, right, top, bounds): per-word lists (Python ints,
+    sorted top-then-left) and (start, end) index pairs, one per line.
+    """
+    raw_text = ocr.get("text", [])
+    n = len(raw_text)
+    if n == 0:
+        return [], [], [], [], [], []
+
+    texts = np.array([str(t).strip() for t in raw_text], dtype=object)
+    conf = _conf_array(ocr["conf"], n)
+    left = np.asarray(ocr["left"], dtype=np.int64)
+    top = np.asarray(ocr["top"], dtype=np.int64)
+    width = np.asarray(ocr["width"], dtype=np.int64) if "width" in ocr else np.zeros(n, dtype=np.int64)
+
+    # drop empty tokens and very low confidence words (negative conf = non-word boxes, kept)
+    keep = (texts != "") & ~((conf >= 0) & (conf < min_confidence))
+    idx = np.flatnonzero(keep)
+    if idx.size == 0:
+        return [], [], [], [], [], []
+
+    # sort by top then left (lexsort is stable, like sorted())
+    order = idx[np.lexsort((left[idx], top[idx]))]
+    top_s = top[order]
+
+    # group into lines: words within line_tolerance px of the line's first word
+    bounds = []
+    start = 0
+    m = order.size
+    while start < m:
+        end = int(np.searchsorted(top_s, top_s[start] + line_tolerance, side="right"))
+        # within a line, order words left to right
+        seg = order[start:end]
+        order[start:end] = seg[np.argsort(left[seg], kind="stable")]
+        bounds.append((start, end))
+        start = end
+
+    return (
+        texts[order].tolist(),
+        conf[order].tolist(),
+        left[order].tolist(),
+        (left[order] + width[order]).tolist(),
+        top[order].tolist(),
+        bounds,
+    )
+
+
+def extract_rows_from_ocr(ocr, min_confidence=40, with_words=True, line_tolerance=LINE_TOP_TOLERANCE):
     """
     Build robust lines with positional info.
-    Returns list of dicts:
-      { "text": str, "avg_conf": int, "min_left": int, "max_right": int, "words": [ (text,left,conf) ] }
-    """
-    n = len(ocr.get("text", []))
-    words = []
-    for i in range(n):
-        txt = str(ocr["text"][i]).strip()
-        if not txt:
-            continue
-        try:
-            conf = int(float(ocr["conf"][i]))
-        except:
-            conf = -1
-        # skip very low confidence words
-        if conf >= 0 and conf < min_confidence:
-            continue
-        left = int(ocr["left"][i])
-        top = int(ocr["top"][i])
-        width = int(ocr.get("width", [0]*n)[i]) if "width" in ocr else 0
-        right = left + width
-        words.append({"text": txt, "left": left, "right": right, "top": top, "conf": conf})
-
-    if not words:
-        return []
-
-    # sort by top then left
-    words = sorted(words, key=lambda w: (w["top"], w["left"]))
-
-    # group into lines: words with top within threshold -> same line
-    lines = []
-    current = {"top": words[0]["top"], "words": [words[0]]}
-    for w in words[1:]:
-        if abs(w["top"] - current["top"]) <= 10:
-            current["words"].append(w)
-        else:
-            lines.append(current)
-            current = {"top": w["top"], "words": [w]}
-    lines.append(current)
+    Returns list of Line records:
+      Line(text, avg_conf, min_left, max_right, words=[Word(text, left, right, top, conf)])
+    Word records are only built when with_words is True; callers that only need
+    line text/confidence can skip them.
+    """
+    texts, conf, left, right, top, bounds = extract_row_arrays(ocr, min_confidence, line_tolerance)
 
     out_lines = []
-    for line in lines:
-        ws = sorted(line["words"], key=lambda x: x["left"])
-        text = " ".join(w["text"] for w in ws)
-        confs = [w["conf"] for w in ws if w["conf"] >= 0]
+    for start, end in bounds:
+        confs = [c for c in conf[start:end] if c >= 0]
         avg_conf = int(sum(confs)/len(confs)) if confs else -1
-        min_left = min(w["left"] for w in ws)
-        max_right = max(w["right"] for w in ws)
-        out_lines.append({
-            "text": text,
-            "avg_conf": avg_conf,
-            "min_left": min_left,
-            "max_right": max_right,
-            "words": ws
-        })
-    return out_lines 
\ No newline at end of file
+        line = Line(" ".join(texts[start:end]), avg_conf, min(left[start:end]), max(right[start:end]))
+        if with_words:
+            line.words = [Word(texts[k], left[k], right[k], top[k], conf[k]) for k in range(start, end)]
+        out_lines.append(line)
+    return out_lines
+
+
+# ------------------ table region (ROI) detection ------------------
+
+def _ruled_table_rows(mask):
+    # horizontal ruling lines: ink runs spanning at least 40% of the page width
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(10, int(mask.shape[1] * 0.4)), 1))
+    rules = np.flatnonzero(cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel).any(axis=1))
+    if rules.size < 2:
+        return None
+    return int(rules[0]), int(rules[-1])
+
+
+def _whitespace_table_rows(mask):
+    # text bands = runs of rows containing ink; split bands into blocks at gaps
+    # much larger than the typical line gap and keep the block with most bands
+    inked = mask.any(axis=1).astype(np.int8)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], inked, [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    if starts.size < 3:
+        return None
+    gaps = starts[1:] - ends[:-1]
+    block_gap = 3 * max(1.0, float(np.median(gaps)))
+    splits = np.flatnonzero(gaps > block_gap) + 1
+    blocks = np.split(np.arange(starts.size), splits)
+    best = max(blocks, key=len)
+    return int(starts[best[0]]), int(ends[best[-1]])
+
+
+def detect_table_region(img):
+    """
+    Locate the line-item table on a page image.
+    Uses horizontal ruling lines when present, otherwise whitespace analysis of
+    the row ink profile. Returns (top, bottom) pixel rows, or None.
+    """
+    gray = pil_to_gray(img)
+    mask, scale = ink_mask(gray, max_width=ROI_ANALYSIS_WIDTH)
+    small_h = mask.shape[0]
+
+    rows = _ruled_table_rows(mask)
+    if rows is None or rows[1] - rows[0] < ROI_MIN_HEIGHT * small_h:
+        rows = _whitespace_table_rows(mask)
+    if rows is None or rows[1] - rows[0] < ROI_MIN_HEIGHT * small_h:
+        return None
+
+    h = gray.shape[0]
+    pad = int(ROI_PADDING * h)
+    top = max(0, int(rows[0] / scale) - pad)
+    bottom = min(h, int(rows[1] / scale) + pad)
+    return top, bottom
+
+
+def _append_ocr(dst, src, dx=0, dy=0, factor=1.0):
+    # append word boxes of `src` to `dst`, mapping crop coordinates back to the page
+    for key in dst:
+        values = src.get(key, [])
+        if key in ("left", "width", "top", "height"):
+            offset = dy if key == "top" else dx if key == "left" else 0
+            values = [int(round(v / factor)) + offset for v in values]
+        dst[key].extend(values)
+
+
+def run_table_region_ocr(img, dpi=300):
+    """
+    OCR only the detected item table at full resolution, plus a cheap
+    low-resolution pass over the footer below it (for printed totals).
+    Falls back to whole-page OCR when no table region is found.
+    Returns an image_to_data-shaped dict in full-page coordinates.
+    """
+    with span("table_detection"):
+        region = detect_table_region(img)
+    if region is None:
+        return run_ocr_on_image(img, dpi=dpi)
+    top, bottom = region
+    w, h = img.size
+
+    table_ocr = run_ocr_on_image(img.crop((0, top, w, bottom)), dpi=dpi)
+    out = {k: [] for k in table_ocr}
+    _append_ocr(out, table_ocr, dy=top)
+
+    if h - bottom > 0:
+        footer = img.crop((0, bottom, w, h))
+        small = footer.resize((max(1, int(w * ROI_FOOTER_SCALE)), max(1, int((h - bottom) * ROI_FOOTER_SCALE))))
+        footer_ocr = run_ocr_on_image(small, dpi=int(dpi * ROI_FOOTER_SCALE))
+        _append_ocr(out, footer_ocr, dy=bottom, factor=ROI_FOOTER_SCALE)
+    return out
+
+
+# ------------------ page geometry (numeric columns) ------------------
+
+@dataclass(slots=True)
+class PageGeometry:
+    """
+    Numeric column layout of a page: disjoint (left, right) x-intervals sorted
+    left to right, and the role ("amount", "rate", "qty" or None) of each.
+    """
+    columns: list
+    tolerance: int = 0
+    roles: list = field(default_factory=list)
+    starts: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self.starts = [c[0] for c in self.columns]
+        if len(self.roles) != len(self.columns):
+            self.roles = [None] * len(self.columns)
+
+    def column_at(self, left, right):
+        """
+        Index of the column containing the centre of span [left, right], or None. O(log n).
+        """
+        if not self.columns:
+            return None
+        center = (left + right) / 2
+        i = bisect.bisect_right(self.starts, center + self.tolerance) - 1
+        if i >= 0 and center <= self.columns[i][1] + self.tolerance:
+            return i
+        return None
+
+    def role_index(self, role):
+        return self.roles.index(role) if role in self.roles else None
+
+    def role_of(self, word):
+        i = self.column_at(word.left, word.right)
+        return None if i is None else self.roles[i]
+
+
+def _column_roles(small_int, leading):
+    """
+    Roles right to left over the columns that sit right of the item text:
+    amount, then rate, then qty. Amount and rate hold money, so a column of
+    small integers only can be qty at most. Index (S.No) columns get none.
+    """
+    roles = [None] * len(small_int)
+    order = [i for i in range(len(small_int) - 1, -1, -1) if not leading[i]]
+    pos = 0
+    for role in ("amount", "rate"):
+        if pos >= len(order) or small_int[order[pos]]:
+            break
+        roles[order[pos]] = role
+        pos += 1
+    if "amount" in roles and pos < len(order):
+        roles[order[pos]] = "qty"
+    return roles
+
+
+def build_page_geometry(lines, scale=1.0):
+    """
+    Cluster the x-extents of numeric words (over all lines of a page) into
+    columns: a 1-D occupancy histogram is split at empty runs of at least
+    COLUMN_MIN_GAP, and columns seen on too few lines are dropped. Roles are
+    then assigned by _column_roles.
+    lines: Line records with words. scale: page DPI / 300.
+    """
+    spans = []
+    span_texts = []
+    text_right = []   # per line: left edge of its rightmost word with letters (item text)
+    for n, ln in enumerate(lines):
+        alpha_lefts = [w.left for w in ln.words if any(ch.isalpha() for ch in w.text)]
+        text_right.append(max(alpha_lefts, default=-1))
+        for w in ln.words:
+            if NUMERIC_WORD_RE.fullmatch(w.text):
+                spans.append((w.left, max(w.left, w.right), n))
+                span_texts.append(w.text)
+    tolerance = max(1, int(COLUMN_TOLERANCE * scale))
+    if not spans:
+        return PageGeometry([], tolerance)
+
+    bin_width = max(1, int(COLUMN_BIN_WIDTH * scale))
+    arr = np.asarray(spans, dtype=np.int64)
+    lo, hi = arr[:, 0] // bin_width, arr[:, 1] // bin_width
+    # difference array: +1 where a word starts, -1 after it ends
+    occupancy = np.zeros(int(hi.max()) + 2, dtype=np.int64)
+    np.add.at(occupancy, lo, 1)
+    np.add.at(occupancy, hi + 1, -1)
+    occupied = np.cumsum(occupancy)[:-1] > 0
+
+    # runs of occupied bins, merged across gaps narrower than COLUMN_MIN_GAP
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], occupied.astype(np.int8), [0]))))
+    runs = []
+    min_gap_bins = max(1, int(COLUMN_MIN_GAP * scale) // bin_width)
+    for start, end in zip(edges[::2], edges[1::2]):
+        if runs and start - runs[-1][1] < min_gap_bins:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+
+    # keep columns that appear on enough distinct lines
+    numeric_lines = len(set(arr[:, 2].tolist()))
+    min_support = max(2, int(np.ceil(COLUMN_MIN_SUPPORT * numeric_lines)))
+    centers = (arr[:, 0] + arr[:, 1]) // 2 // bin_width
+    columns, small_int, leading = [], [], []
+    for start, end in runs:
+        in_run = np.flatnonzero((centers >= start) & (centers < end))
+        col_lines = set(arr[in_run, 2].tolist())
+        if len(col_lines) < min_support:
+            continue
+        columns.append((int(start * bin_width), int(end * bin_width)))
+        small_int.append(all(COLUMN_SMALL_INT_RE.fullmatch(span_texts[j]) for j in in_run))
+        # item text to the right on most of its lines: an index (S.No) column
+        with_text = sum(1 for k in col_lines if text_right[k] > end * bin_width)
+        leading.append(with_text >= COLUMN_LEADING_SUPPORT * len(col_lines))
+    return PageGeometry(columns, tolerance, _column_roles(small_int, leading))
@@ -0,0 +1,150 @@
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+
+from src import batch, pipeline
+from src.batch import JsonlWriter
+
+
+def test_repair_tail_drops_only_the_torn_last_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    good = b"".join(b'{"id": "%d"}\n' % i for i in range(5000))
+    path.write_bytes(good + b'{"id": "torn')
+    JsonlWriter._repair_tail(str(path), block=1000)
+    assert path.read_bytes() == good
+
+    path.write_bytes(good)
+    JsonlWriter._repair_tail(str(path), block=1000)
+    assert path.read_bytes() == good
+
+    path.write_bytes(b'{"id": "torn, no newline at all')
+    JsonlWriter._repair_tail(str(path), block=8)
+    assert path.read_bytes() == b""
+
+
+def test_sync_extraction_uses_the_pipeline_page_plan(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pipeline, "TEXT_LAYER_ENABLED", False)
+    monkeypatch.setattr(pipeline, "ADAPTIVE_DPI", True)
+    monkeypatch.setattr(pipeline, "ADAPTIVE_LOW_DPI", 150)
+    monkeypatch.setattr(pipeline, "OCR_BATCH_PAGES", 2)
+    monkeypatch.setattr(pipeline, "pdf_page_count", lambda path: 3)
+    monkeypatch.setattr(pipeline, "iter_pdf_pages",
+                        lambda path, pages, dpi=300: ((n, ("img", n, dpi)) for n in pages))
+    monkeypatch.setattr(pipeline, "process_pages",
+                        lambda imgs, page_nos, conf, dpi, pdf_path, include_lines:
+                        calls.append(("chunk", page_nos, dpi)) or [{"page_no": n} for n in page_nos])
+    monkeypatch.setattr(pipeline, "process_page",
+                        lambda img, page_no, conf, dpi, pdf_path, ocr, include_lines:
+                        calls.append(("page", page_no, dpi)) or {"page_no": page_no})
+
+    monkeypatch.setattr(pipeline, "ROI_OCR", False)
+    pages = pipeline.extract_document_sync("doc.pdf")
+    assert [p["page_no"] for p in pages] == ["1", "2", "3"]
+    assert calls == [("chunk", ["1", "2"], 150), ("chunk", ["3"], 150)]
+
+    calls.clear()
+    monkeypatch.setattr(pipeline, "ROI_OCR", True)
+    pipeline.extract_document_sync("doc.pdf")
+    assert calls == [("page", "1", 150), ("page", "2", 150), ("page", "3", 150)]
+
+
+def test_run_batch_resumes_from_the_checkpoint(tmp_path, monkeypatch):
+    seen = []
+
+    def fake_extract(document, conservative_min_conf=40, include_lines=False):
+        seen.append(document)
+        if document == "bad.pdf":
+            raise ValueError("unreadable")
+        return {"total_item_count": 0, "pagewise_line_items": []}, 2
+
+    _thread_pool(monkeypatch, fake_extract)
+    output = str(tmp_path / "out.jsonl")
+    # a killed run: a.pdf was written and checkpointed, b.pdf was torn mid-write
+    with open(output, "wb") as f:
+        f.write(b'{"id": "a.pdf", "is_success": true}\n{"id": "b.pd')
+    with open(output + ".checkpoint", "w") as f:
+        f.write("a.pdf\n")
+
+    stats = batch.run_batch(["a.pdf", "b.pdf", "bad.pdf"], output, workers=2, report=lambda msg: None)
+    assert sorted(seen) == ["b.pdf", "bad.pdf"]
+    assert (stats["skipped"], stats["done"], stats["failed"], stats["pages"]) == (1, 2, 1, 2)
+    with open(output, "rb") as f:
+        records = [orjson.loads(line) for line in f]
+    assert sorted(r["id"] for r in records) == ["a.pdf", "b.pdf", "bad.pdf"]
+    assert [r["error"] for r in records if not r["is_success"]] == ["ValueError: unreadable"]
+
+    seen.clear()
+    stats = batch.run_batch(["a.pdf", "b.pdf", "bad.pdf"], output, workers=2, report=lambda msg: None)
+    assert seen == []
+    assert stats["skipped"] == 3
+
+
+def _thread_pool(monkeypatch, fake_extract):
+    monkeypatch.setattr(batch, "extract_bill_sync", fake_extract)
+    monkeypatch.setattr(batch, "ProcessPoolExecutor",
+                        lambda max_workers, initializer: ThreadPoolExecutor(max_workers))
+
+
+def test_records_written_but_not_checkpointed_are_not_redone(tmp_path, monkeypatch):
+    seen = []
+    _thread_pool(monkeypatch, lambda document, *args, **kwargs: seen.append(document) or
+                 ({"pagewise_line_items": []}, 1))
+    output = str(tmp_path / "out.jsonl")
+    # killed after b.pdf and c.pdf were written but before they were checkpointed
+    with open(output, "wb") as f:
+        for doc_id in ("a.pdf", "b.pdf", "c.pdf"):
+            f.write(b'{"id": "%s", "is_success": true, "pad": "%s"}\n' % (doc_id.encode(), b"x" * 3000))
+    with open(output + ".checkpoint", "w") as f:
+        f.write("a.pdf\n")
+
+    assert JsonlWriter(output).unrecorded_ids({"a.pdf"}, block=1000) == ["c.pdf", "b.pdf"]
+    stats = batch.run_batch(["a.pdf", "b.pdf", "c.pdf", "d.pdf"], output, workers=1, report=lambda msg: None)
+    assert seen == ["d.pdf"]
+    assert stats["skipped"] == 3
+    assert sorted(batch.load_checkpoint(output + ".checkpoint")) == ["a.pdf", "b.pdf", "c.pdf", "d.pdf"]
+
+
+def test_malformed_manifest_lines_are_recorded_and_skipped(tmp_path, monkeypatch):
+    seen = []
+    _thread_pool(monkeypatch, lambda document, *args, **kwargs: seen.append(document) or
+                 ({"pagewise_line_items": []}, 1))
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text('{"document": "a.pdf"}\n{"document": \n[1, 2]\n\n{"document": "b.pdf", "id": "b"}\n')
+    output = str(tmp_path / "out.jsonl")
+
+    stats = batch.run_batch([str(manifest)], output, workers=1, report=lambda msg: None)
+    assert seen == ["a.pdf", "b.pdf"]
+    assert (stats["done"], stats["failed"]) == (4, 2)
+    with open(output, "rb") as f:
+        failed = [r for r in map(orjson.loads, f) if not r["is_success"]]
+    assert [r["id"] for r in failed] == [f"{manifest}:2", f"{manifest}:3"]
+    assert all(r["error"].startswith("ManifestLineError: malformed manifest line") for r in failed)
+
+
+_SLOW_BATCH = """
+import sys, time
+from src import batch
+batch.extract_bill_sync = lambda document, *args, **kwargs: time.sleep(60)
+print("ready", flush=True)
+batch.run_batch(["a.pdf", "b.pdf"], sys.argv[1], workers=2, report=lambda msg: None)
+"""
+
+
+def test_second_signal_aborts_documents_in_flight(tmp_path):
+    proc = subprocess.Popen([sys.executable, "-c", _SLOW_BATCH, str(tmp_path / "out.jsonl")],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        assert proc.stdout.readline() == b"ready\n"
+        time.sleep(1.0)
+        proc.send_signal(signal.SIGINT)
+        time.sleep(0.3)
+        proc.send_signal(signal.SIGINT)
+        assert proc.wait(timeout=15) != 0
+    finally:
+        proc.kill()
+    assert (tmp_path / "out.jsonl").read_bytes() == b""
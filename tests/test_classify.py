@@ -0,0 +1,26 @@
+from src.lineitem_extractor import classify_line, filter_header_footer_lines
+from src.records import Line
+
+
+def test_classify_line_tags():
+    tags = classify_line("Room rent 2 1,500.00 3,000.00")
+    assert tags["numeric_tokens"] == ["2", "1,500", "00", "3,000", "00"]
+    assert not any(tags[k] for k in ("json_like", "total", "header_footer", "timestamp", "page_number"))
+
+    assert classify_line("12")["page_number"]
+    assert not classify_line("1234")["page_number"]
+    assert classify_line("Printed on 12/03/2024")["timestamp"]
+    assert classify_line("Page 1 of 2")["header_footer"]
+    assert classify_line("1,234.00")["total"]
+
+
+def test_classify_line_caches_tags_on_line_records():
+    ln = Line("Pharmacy 450.00", 90, 0, 0)
+    tags = classify_line(ln)
+    assert ln.tags is tags
+    assert classify_line(ln) is tags
+
+
+def test_filter_header_footer_lines_accepts_lines_and_strings():
+    kept = filter_header_footer_lines(["Page", "7", "Pharmacy 450.00", Line("Consultation 800.00", 90, 0, 0)])
+    assert [ln.text if isinstance(ln, Line) else ln for ln in kept] == ["Pharmacy 450.00", "Consultation 800.00"]
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import tempfile
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import app as api
+from src import fetch
+from src.fetch import DocumentTooLargeError, fetch_to_tempfile, open_document
+
+
+@pytest.fixture
+def serve(monkeypatch, tmp_path):
+    """
+    Route the shared client through an httpx.MockTransport; temp files go to tmp_path.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    def serve(handler):
+        monkeypatch.setattr(fetch, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    return serve
+
+
+async def _chunks(n, size=1000):
+    for _ in range(n):
+        yield b"x" * size
+
+
+def test_download_is_streamed_to_a_temp_file_and_removed_after_use(serve, tmp_path):
+    serve(lambda request: httpx.Response(200, content=b"%PDF-1.4 bill", headers={"content-type": "application/pdf"}))
+
+    async def run():
+        async with open_document("https://example.com/download?id=7") as path:
+            with open(path, "rb") as f:
+                return path, f.read()
+
+    path, body = asyncio.run(run())
+    assert body == b"%PDF-1.4 bill"
+    assert path.endswith(".pdf") and os.path.dirname(path) == str(tmp_path)
+    assert not os.path.exists(path)
+
+
+def test_temp_file_is_removed_when_the_caller_fails(serve, tmp_path):
+    serve(lambda request: httpx.Response(200, content=b"png", headers={"content-type": "image/png"}))
+
+    async def run():
+        async with open_document("https://example.com/bill.png"):
+            raise RuntimeError("extraction failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert os.listdir(tmp_path) == []
+
+
+def test_declared_size_over_the_limit_is_refused_before_download(serve, tmp_path):
+    serve(lambda request: httpx.Response(200, content=b"x" * 5000))
+    with pytest.raises(DocumentTooLargeError):
+        asyncio.run(fetch_to_tempfile("https://example.com/big.pdf", max_bytes=4096))
+    assert os.listdir(tmp_path) == []
+
+
+def test_streamed_size_over_the_limit_removes_the_partial_file(serve, tmp_path):
+    # chunked response: no content-length to check up front
+    serve(lambda request: httpx.Response(200, content=_chunks(10)))
+    with pytest.raises(DocumentTooLargeError):
+        asyncio.run(fetch_to_tempfile("https://example.com/big.pdf", max_bytes=4096))
+    assert os.listdir(tmp_path) == []
+    assert os.path.getsize(asyncio.run(fetch_to_tempfile("https://example.com/ok.pdf", max_bytes=10000))) == 10000
+
+
+def test_api_answers_413_for_oversized_documents(serve, monkeypatch):
+    monkeypatch.setattr(fetch_to_tempfile, "__defaults__", (10,))
+    serve(lambda request: httpx.Response(200, content=b"x" * 100))
+    response = TestClient(api.app).post("/extract-bill-data", json={"document": "https://example.com/big.pdf"})
+    assert response.status_code == 413
+    assert "limit is 10" in response.json()["error"]
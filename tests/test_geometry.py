@@ -0,0 +1,63 @@
+from src.lineitem_extractor import extract_pagewise_line_items
+from src.table_detector import build_page_geometry, extract_rows_from_ocr
+
+
+def _ocr(rows):
+    """image_to_data-style dict from rows of (text, left) words, one row per 40px."""
+    data = {"text": [], "conf": [], "left": [], "top": [], "width": [], "height": []}
+    for r, row in enumerate(rows):
+        for text, left in row:
+            data["text"].append(text)
+            data["conf"].append(92)
+            data["left"].append(left)
+            data["top"].append(100 + r * 40)
+            data["width"].append(len(text) * 18)
+            data["height"].append(22)
+    return data
+
+
+def _items(rows):
+    return extract_pagewise_line_items(None, "1", ocr=_ocr(rows))["bill_items"]
+
+
+def test_serial_numbers_get_no_role_and_quantities_are_not_rates():
+    rows = [[("S.No", 50), ("Description", 200), ("Qty", 1000), ("Amount", 1550)]]
+    for k in range(1, 7):
+        rows.append([(str(k), 60), (f"Dressing{k}", 200), ("kit", 400), (str(k + 1), 1010), (f"{150 * k}.00", 1560)])
+    geometry = build_page_geometry(extract_rows_from_ocr(_ocr(rows), min_confidence=10))
+    assert geometry.roles == [None, "qty", "amount"]
+
+    first = _items(rows)[0]
+    assert (first.item_quantity, first.item_rate, first.item_amount) == (2.0, 0.0, 150.0)
+
+
+def test_rate_column_between_qty_and_amount():
+    rows = [[("Description", 200), ("Qty", 1000), ("Rate", 1250), ("Amount", 1550)]]
+    for k in range(1, 7):
+        rows.append([(f"Syringe{k}", 200), ("pack", 400), (str(k), 1010), ("12.50", 1250), (f"{12.5 * k:.2f}", 1560)])
+    geometry = build_page_geometry(extract_rows_from_ocr(_ocr(rows), min_confidence=10))
+    assert geometry.roles == ["qty", "rate", "amount"]
+
+
+def test_continuation_lines_merge_next_to_a_serial_number_column():
+    rows = [[("S.No", 50), ("Description", 200), ("Amount", 1550)]]
+    rows.append([("1", 60), ("Paracetamol", 200), ("Tablet", 420), ("50.00", 1560)])
+    rows.append([("500mg", 200), ("strip", 330), ("pack", 440)])
+    for k in range(2, 7):
+        rows.append([(str(k), 60), (f"Syringe{k}", 200), ("disposable", 400), (f"{12 * k}.00", 1560)])
+    items = _items(rows)
+    assert items[0].item_name == "1 Paracetamol Tablet 500mg strip pack"
+    assert (items[0].item_quantity, items[0].item_rate) == (0.0, 0.0)
+    assert items[1].item_name == "2 Syringe2 disposable"
+
+
+def test_same_columns_at_any_dpi():
+    rows = [[("Description", 200), ("Qty", 1000), ("Amount", 1550)]]
+    for k in range(1, 7):
+        rows.append([(f"Item{k}", 200), (str(k), 1010), (f"{100 * k}.00", 1560)])
+    full = build_page_geometry(extract_rows_from_ocr(_ocr(rows), min_confidence=10))
+    half_rows = [[(t, left // 2) for t, left in row] for row in rows]
+    half_ocr = _ocr(half_rows)
+    half_ocr["width"] = [w // 2 for w in half_ocr["width"]]
+    half = build_page_geometry(extract_rows_from_ocr(half_ocr, min_confidence=10), scale=0.5)
+    assert full.roles == half.roles == ["qty", "amount"]
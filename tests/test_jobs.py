@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+
+from src.jobs import DONE, FAILED, QUEUED, JobScheduler, JobStore, QueueFullError
+
+
+def _stores(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    return JobStore(path, owner="a"), JobStore(path, owner="b")
+
+
+def test_startup_sweep_leaves_live_owners_jobs_alone(tmp_path):
+    a, b = _stores(tmp_path)
+    a.heartbeat()
+    job = a.create("doc.pdf")
+    b.heartbeat()
+    assert b.fail_orphaned("restart") == 0
+    assert b.get(job)["status"] == QUEUED
+
+
+def test_jobs_of_a_dead_owner_are_failed(tmp_path):
+    a, b = _stores(tmp_path)
+    a.heartbeat()
+    job = a.create("doc.pdf")
+    done = a.create("done.pdf")
+    a.update(done, DONE, result={})
+    time.sleep(0.02)
+    assert b.fail_orphaned("restart", timeout=0.01) == 1
+    assert b.get(job)["status"] == FAILED
+    assert b.get(done)["status"] == DONE
+
+
+def test_shutdown_only_fails_own_jobs(tmp_path):
+    a, b = _stores(tmp_path)
+    mine, theirs = a.create("a.pdf"), b.create("b.pdf")
+    a.fail_unfinished("shutdown")
+    assert a.get(mine)["status"] == FAILED
+    assert a.get(theirs)["status"] == QUEUED
+
+
+def test_submissions_are_stored_in_one_transaction_and_reserve_queue_space(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), owner="a")
+    scheduler = JobScheduler(store, workers=0, max_queue=5)
+    inserts = []
+    create_many = store.create_many
+    store.create_many = lambda jobs: inserts.append(len(jobs)) or create_many(jobs)
+
+    async def run():
+        await scheduler.start()
+        try:
+            # the second batch is checked while the first is still being stored
+            first = asyncio.ensure_future(scheduler.submit_many([(f"{i}.pdf", i % 2, {}) for i in range(3)]))
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFullError):
+                await scheduler.submit_many([("x.pdf", 0, {}), ("y.pdf", 0, {}), ("z.pdf", 0, {})])
+            return await first
+        finally:
+            await scheduler.stop()
+
+    job_ids = asyncio.run(run())
+    assert inserts == [3]
+    assert [store.get(j)["document"] for j in job_ids] == ["0.pdf", "1.pdf", "2.pdf"]
@@ -0,0 +1,50 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi.testclient import TestClient
+
+import app as api
+from src import metrics, pipeline
+
+
+def _page_job(page_no):
+    # runs in a pool worker, where observations are buffered
+    with metrics.span("test_worker_stage"):
+        time.sleep(0.002)
+    metrics.count("test_worker_pages")
+    return page_no
+
+
+def test_worker_spans_reach_the_metrics_endpoint(monkeypatch):
+    executor = ProcessPoolExecutor(max_workers=2, initializer=metrics.set_worker_mode)
+    monkeypatch.setattr(pipeline, "get_executor", lambda: executor)
+
+    async def run():
+        slots = asyncio.Semaphore(4)
+        futures = []
+        for page_no in range(3):
+            await slots.acquire()
+            futures.append(pipeline._submit_page(slots, _page_job, page_no))
+        return await asyncio.gather(*futures)
+
+    try:
+        assert asyncio.run(run()) == [0, 1, 2]
+    finally:
+        executor.shutdown()
+
+    body = TestClient(api.app).get("/metrics").text
+    assert 'bill_stage_seconds_count{stage="test_worker_stage"} 3.0' in body
+    assert 'bill_stage_seconds_bucket{le="0.001",stage="test_worker_stage"} 0.0' in body
+    assert 'bill_events_total{event="test_worker_pages"} 3.0' in body
+
+
+def test_worker_mode_buffers_until_drained(monkeypatch):
+    monkeypatch.setattr(metrics, "_worker_mode", True)
+    with metrics.span("test_buffered_stage"):
+        pass
+    metrics.count("test_buffered_event", 2)
+    timings, events = metrics.drain()
+    assert [stage for stage, _ in timings] == ["test_buffered_stage"]
+    assert events == {"test_buffered_event": 2}
+    assert metrics.drain() == ([], {})
@@ -0,0 +1,175 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from PIL import Image
+
+from src import near_duplicates, pipeline
+from src.near_duplicates import (
+    BKTree, NearDuplicateIndex, hamming, replay_data, verification_digest, verify_near_duplicate,
+)
+from src.records import BillItem
+from src.result_cache import HIT, MISS, NEAR_DUPLICATE, ResultCache
+
+
+def test_bktree_search_matches_brute_force():
+    rng = random.Random(1)
+    hashes = [rng.getrandbits(64) for _ in range(3000)]
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        tree.add(h, i)
+    for q in (hashes[17] ^ 0b1011, rng.getrandbits(64), hashes[5]):
+        found = sorted(v for _, v in tree.search(q, 6))
+        assert found == [i for i, h in enumerate(hashes) if hamming(h, q) <= 6]
+
+
+def test_index_needs_same_page_count_params_and_every_page_close():
+    index = NearDuplicateIndex(max_distance=2)
+    index.add([0b0000, 0b1111], "p", {"id": "a"})
+    assert index.find([0b0001, 0b1110], "p") == {"id": "a"}
+    assert index.find([0b0001, 0b1110], "other") is None
+    assert index.find([0b0001], "p") is None
+    assert index.find([0b0001, 0b0000], "p") is None
+
+
+def test_index_evicts_oldest_documents():
+    index = NearDuplicateIndex(max_distance=0, max_documents=2)
+    for i in range(5):
+        index.add([i << 8], "p", {"id": i})
+    assert index.find([0], "p") is None
+    assert index.find([4 << 8], "p") == {"id": 4}
+
+
+def test_replay_data_drops_ocr_lines():
+    data = {"pagewise_line_items": [{"page_no": "1", "bill_items": [], "lines": [1], "ocr_lines": [2]}],
+            "printed_total": 10.0}
+    slim = replay_data(data)
+    assert slim["pagewise_line_items"] == [{"page_no": "1", "bill_items": []}]
+    assert "lines" in data["pagewise_line_items"][0]
+
+
+@pytest.fixture
+def near_dup(monkeypatch, tmp_path):
+    """
+    Every document hashes alike; verification compares the candidate's digest
+    with what each file "reads as", and extract_bill returns a result tagged
+    with the extracted file.
+    """
+    contents = {}
+    extracted = []
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def extract_bill(path, conservative_min_conf=40, include_lines=False):
+        extracted.append(path)
+        amounts, total = contents[path]
+        page = {"page_no": "1", "bill_items": [BillItem(f"item {a}", 1.0, a, a) for a in amounts]}
+        return {"pagewise_line_items": [page], "printed_total": total, "source": path}
+
+    monkeypatch.setattr(pipeline, "NEAR_DUP_ENABLED", True)
+    monkeypatch.setattr(pipeline, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(pipeline, "_result_cache", ResultCache())
+    monkeypatch.setattr(pipeline, "_near_dup_index", NearDuplicateIndex())
+    monkeypatch.setattr(pipeline, "_page_slots", None)
+    monkeypatch.setattr(pipeline, "get_executor", lambda: executor)
+    monkeypatch.setattr(pipeline, "document_hashes", lambda path, dpi, size: [0xABCD])
+    monkeypatch.setattr(pipeline, "verify_near_duplicate",
+                        lambda path, digest, dpi: digest == ({1: contents[path][0]}, contents[path][1]))
+    monkeypatch.setattr(pipeline, "extract_bill", extract_bill)
+
+    def document(name, total, amounts=(1000.0, 250.0)):
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        contents[str(path)] = (list(amounts), total)
+        return str(path)
+
+    yield document, extracted
+    executor.shutdown()
+
+
+def test_near_duplicate_with_the_same_total_is_reused_but_not_cached(near_dup):
+    document, extracted = near_dup
+    original, rescan = document("a.png", 1250.0), document("b.png", 1250.0)
+
+    async def run():
+        first = await pipeline.extract_bill_cached(original)
+        second = await pipeline.extract_bill_cached(rescan)
+        third = await pipeline.extract_bill_cached(rescan)
+        return first, second, third
+
+    (_, s1), (d2, s2), (d3, s3) = asyncio.run(run())
+    assert (s1, s2, s3) == (MISS, NEAR_DUPLICATE, NEAR_DUPLICATE)
+    assert d2["source"] == d3["source"] == original
+    assert extracted == [original]
+
+
+def test_same_template_and_total_with_other_items_is_extracted(near_dup):
+    document, extracted = near_dup
+    first, other = document("a.png", 1250.0), document("c.png", 1250.0, amounts=(1200.0, 50.0))
+
+    async def run():
+        await pipeline.extract_bill_cached(first)
+        return await pipeline.extract_bill_cached(other)
+
+    data, status = asyncio.run(run())
+    assert status == MISS
+    assert data["source"] == other
+    assert extracted == [first, other]
+    assert pipeline._page_slots._value == pipeline.MAX_PENDING_PAGES
+
+
+def test_same_template_with_another_total_is_extracted(near_dup):
+    document, extracted = near_dup
+    first, other = document("a.png", 1250.0), document("c.png", 980.0, amounts=(730.0, 250.0))
+
+    async def run():
+        await pipeline.extract_bill_cached(first)
+        data, status = await pipeline.extract_bill_cached(other)
+        again = await pipeline.extract_bill_cached(other)
+        return data, status, again[1]
+
+    data, status, again = asyncio.run(run())
+    assert (status, again) == (MISS, HIT)
+    assert data["source"] == other
+    assert extracted == [first, other]
+
+
+def test_stream_replays_a_verified_near_duplicate_without_caching_it(near_dup):
+    document, extracted = near_dup
+    original, rescan = document("a.png", 1250.0), document("b.png", 1250.0)
+
+    async def run():
+        await pipeline.extract_bill_cached(original)
+        return [data async for _, data in pipeline.iter_bill(rescan)]
+
+    assert asyncio.run(run())[-1]["source"] == original
+    assert extracted == [original]
+    assert len(pipeline._result_cache._entries) == 1
+
+
+def _ocr_of(*texts):
+    ocr = {"text": [], "conf": [], "left": [], "top": [], "width": []}
+    for row, text in enumerate(texts):
+        for col, word in enumerate(text.split()):
+            for key, value in zip(ocr, (word, 90, 100 * col, 40 * row, 80)):
+                ocr[key].append(value)
+    return ocr
+
+
+def test_verification_reads_every_stored_amount_and_the_total(monkeypatch, tmp_path):
+    path = str(tmp_path / "bill.png")
+    Image.new("L", (60, 80), 255).save(path)
+    page = {"page_no": "1", "bill_items": [BillItem("Room rent", 1.0, 1200.0, 1200.0),
+                                           BillItem("Pharmacy", 1.0, 50.0, 50.0)]}
+    digest = verification_digest({"pagewise_line_items": [page], "printed_total": 1250.0})
+    assert digest == ({1: [1200.0, 50.0]}, 1250.0)
+
+    def reads_as(*texts):
+        monkeypatch.setattr(near_duplicates, "run_ocr_on_image", lambda img, dpi=None: _ocr_of(*texts))
+        return verify_near_duplicate(path, digest, dpi=150)
+
+    assert reads_as("Room rent 1,200.00", "Pharmacy 50.00", "Grand Total 1,250.00")
+    assert not reads_as("Room rent 1,150.00", "Pharmacy 100.00", "Grand Total 1,250.00")
+    assert not reads_as("Room rent 1,200.00", "Pharmacy 50.00", "Grand Total 1,300.00")
+    assert not reads_as("Room rent 1,200.00", "Pharmacy 50.00")
@@ -0,0 +1,88 @@
+import sqlite3
+
+from PIL import Image
+
+from src import ocr, ocr_cache
+from src.ocr_cache import OCRCache, ocr_cache_key
+
+
+def _data(text, n=1):
+    return {"text": [text] * n, "conf": [90] * n, "left": list(range(n)), "top": [0] * n}
+
+
+def _disk_size(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+
+
+def test_hits_from_memory_and_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = OCRCache(path, max_bytes=10 ** 6, memory_items=4)
+    assert cache.get("a") is None
+    cache.put("a", _data("Room"))
+    assert cache.get("a") == _data("Room")
+
+    # another process: only the SQLite file is shared
+    other = OCRCache(path, max_bytes=10 ** 6, memory_items=4)
+    assert other.get("a") == _data("Room")
+    assert (cache.hits_memory, cache.misses, other.hits_disk) == (1, 1, 1)
+
+
+def test_cached_results_cannot_be_mutated_by_callers(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.sqlite3"), max_bytes=10 ** 6, memory_items=4)
+    data = _data("Room")
+    cache.put("a", data)
+    data["text"][0] = "changed"
+    cache.get("a")["text"].append("extra")
+    assert cache.get("a") == _data("Room")
+
+
+def test_eviction_keeps_the_file_under_max_bytes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = OCRCache(path, max_bytes=10 ** 6, memory_items=1)
+    cache.put("probe", _data("x" * 40, 50))
+    entry = cache.stats()["disk_bytes"]
+    cache = OCRCache(str(tmp_path / "small.sqlite3"), max_bytes=3 * entry, memory_items=1)
+    for i in range(6):
+        cache.put(f"k{i}", _data(f"{i}" * 40, 50))
+    # rewriting a key replaces its size in the running total
+    cache.put("k5", _data("5" * 40, 50))
+
+    stats = cache.stats()
+    assert stats["disk_entries"] == 3
+    assert stats["disk_bytes"] == _disk_size(str(tmp_path / "small.sqlite3")) <= 3 * entry
+    assert cache.evictions == 3
+    assert cache.get("k0") is None and cache.get("k5") == _data("5" * 40, 50)
+
+
+def test_running_total_is_seeded_from_an_existing_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    OCRCache(path, max_bytes=10 ** 6, memory_items=1).put("a", _data("Room", 20))
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE ocr_cache_size")
+    assert OCRCache(path, max_bytes=10 ** 6, memory_items=1).stats()["disk_bytes"] == _disk_size(path)
+
+
+def test_format_and_engine_versions_invalidate_entries(tmp_path, monkeypatch):
+    img = Image.new("L", (20, 10), 255)
+    key = ocr_cache_key(img, "cfg", 300)
+    monkeypatch.setattr(ocr_cache, "CACHE_FORMAT_VERSION", ocr_cache.CACHE_FORMAT_VERSION + 1)
+    assert ocr_cache_key(img, "cfg", 300) != key
+
+    class Backend:
+        name = "fake"
+        version = "5.3.0"
+        calls = 0
+
+        def image_to_data(self, image, config=""):
+            Backend.calls += 1
+            return _data(self.version)
+
+    backend = Backend()
+    monkeypatch.setattr(ocr, "get_ocr_backend", lambda: backend)
+    monkeypatch.setattr(ocr, "get_ocr_cache", lambda: OCRCache(str(tmp_path / "c.sqlite3"), 10 ** 6, 4))
+    assert ocr.run_ocr_on_image(img, dpi=300) == _data("5.3.0")
+    assert ocr.run_ocr_on_image(img, dpi=300) == _data("5.3.0")
+    backend.version = "5.4.1"
+    assert ocr.run_ocr_on_image(img, dpi=300) == _data("5.4.1")
+    assert Backend.calls == 2
@@ -0,0 +1,74 @@
+import queue
+from types import SimpleNamespace
+
+from src.ocr import TesserocrPoolBackend
+
+
+class FakeAPI:
+    """
+    Stands in for tesserocr.PyTessBaseAPI: records the variables and page
+    segmentation mode in effect when each image is recognized.
+    """
+    def __init__(self):
+        self.variables = {"tessedit_char_whitelist": "", "preserve_interword_spaces": "0"}
+        self.psm = 3
+        self.seen = []
+
+    def SetPageSegMode(self, psm):
+        self.psm = psm
+
+    def GetVariableAsString(self, name):
+        return self.variables.get(name)
+
+    def SetVariable(self, name, value):
+        if name not in self.variables:
+            return False
+        self.variables[name] = value
+        return True
+
+    def SetImage(self, image):
+        pass
+
+    def Recognize(self):
+        self.seen.append((self.psm, dict(self.variables)))
+
+    def GetIterator(self):
+        return None
+
+    def Clear(self):
+        pass
+
+
+def _backend(api):
+    backend = TesserocrPoolBackend.__new__(TesserocrPoolBackend)
+    backend._tesserocr = SimpleNamespace(PSM=SimpleNamespace(AUTO=3), RIL=SimpleNamespace(WORD=3),
+                                         iterate_level=lambda it, level: [])
+    backend._engines = queue.LifoQueue()
+    backend._engines.put(api)
+    return backend
+
+
+def test_per_call_config_does_not_leak_into_later_calls():
+    api = FakeAPI()
+    backend = _backend(api)
+    defaults = dict(api.variables)
+
+    backend.image_to_data(None, config="--psm 6 -c tessedit_char_whitelist=0123456789., -c unknown_var=1")
+    assert api.variables == defaults
+    backend.image_to_data(None)
+    assert api.seen == [
+        (6, {**defaults, "tessedit_char_whitelist": "0123456789.,"}),
+        (3, defaults),
+    ]
+
+
+def test_config_is_restored_when_recognition_fails():
+    api = FakeAPI()
+    api.Recognize = lambda: 1 / 0
+    backend = _backend(api)
+    try:
+        backend.image_to_data(None, config="-c preserve_interword_spaces=1")
+    except ZeroDivisionError:
+        pass
+    assert api.variables["preserve_interword_spaces"] == "0"
+    assert backend._engines.get_nowait() is api
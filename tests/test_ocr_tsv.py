@@ -0,0 +1,33 @@
+from PIL import Image
+
+from src.ocr import _write_page, split_tsv_pages
+
+_HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+
+
+def _row(page, word, text):
+    return f"5\t{page}\t1\t1\t1\t{word}\t{10 * word}\t20\t8\t12\t91.5\t{text}"
+
+
+def test_split_tsv_pages_gives_one_single_page_dict_per_image():
+    tsv = "\n".join([_HEADER, _row(1, 1, "Room"), _row(1, 2, "rent"), _row(3, 1, "Total")])
+    pages = split_tsv_pages(tsv, 3)
+    assert [p["text"] for p in pages] == [["Room", "rent"], [], ["Total"]]
+    assert pages[0]["page_num"] == [1, 1]
+    assert pages[2]["page_num"] == [1]
+    assert pages[2]["left"] == [10]
+    assert set(pages[1]) == set(pages[0])
+
+
+def test_pages_are_written_as_pnm_without_touching_the_image(tmp_path):
+    img = Image.new("L", (30, 20), 255)
+    path = _write_page(img, str(tmp_path / "page"))
+    assert path.endswith(".pnm")
+    assert img.format is None
+    with Image.open(path) as written:
+        assert written.format == "PPM" and written.tobytes() == img.tobytes()
+
+    img.save(tmp_path / "scan.png")
+    with Image.open(tmp_path / "scan.png") as loaded:
+        assert _write_page(loaded, str(tmp_path / "loaded")).endswith(".png")
+        assert loaded.format == "PNG"
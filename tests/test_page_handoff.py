@@ -0,0 +1,34 @@
+import numpy as np
+from PIL import Image
+
+from src.page_handoff import SharedPage, open_page, release_page, share_page
+from src.pipeline import _compact
+from src.records import BillItem, Line, Word
+
+
+def test_rgb_pages_are_shared_as_grayscale():
+    img = Image.fromarray(np.random.default_rng(0).integers(0, 255, (40, 30, 3), dtype=np.uint8), "RGB")
+    page = share_page(img)
+    try:
+        assert isinstance(page, SharedPage) and page.mode == "L"
+        with open_page(page) as shared:
+            assert shared.size == img.size
+            assert shared.tobytes() == img.convert("L").tobytes()
+    finally:
+        release_page(page)
+
+
+def test_compact_page_result_keeps_only_reconciliation_lines():
+    word = Word("x", 0, 10, 0, 90)
+    lines = [Line(f"row {i} 10.00", 90, 0, 100, [word]) for i in range(20)]
+    lines.append(Line("Grand Total 200.00", 90, 0, 100, [word]))
+    result = {"page_no": "1", "bill_items": [BillItem("row", 1.0, 10.0, 10.0)], "lines": lines, "ocr_lines": lines}
+
+    kept = _compact(dict(result), include_lines=True)
+    assert kept["lines"] is lines
+
+    compact = _compact(dict(result), include_lines=False)
+    assert "lines" not in compact
+    assert [ln.text for ln in compact["ocr_lines"]][-1] == "Grand Total 200.00"
+    assert len(compact["ocr_lines"]) == 7
+    assert all(not ln.words for ln in compact["ocr_lines"])
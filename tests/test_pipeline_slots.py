@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import pipeline
+
+PAGES = 10
+
+
+@pytest.fixture
+def stub_pipeline(monkeypatch):
+    """
+    Pages are "rendered" and "OCR'd" by stubs on a thread pool, with a page
+    budget smaller than what concurrent documents' partial chunks could hold.
+    """
+    executor = ThreadPoolExecutor(max_workers=2)
+    chunks = []
+    monkeypatch.setattr(pipeline, "get_executor", lambda: executor)
+    monkeypatch.setattr(pipeline, "_page_slots", None)
+    monkeypatch.setattr(pipeline, "MAX_PENDING_PAGES", 4)
+    monkeypatch.setattr(pipeline, "OCR_BATCH_PAGES", 4)
+    monkeypatch.setattr(pipeline, "ROI_OCR", False)
+    monkeypatch.setattr(pipeline, "TEXT_LAYER_ENABLED", False)
+    monkeypatch.setattr(pipeline, "PAGE_HANDOFF", "pickle")
+    monkeypatch.setattr(pipeline, "pdf_page_count", lambda path: PAGES)
+
+    def iter_pdf_pages(path, page_numbers, dpi=300):
+        for n in page_numbers:
+            time.sleep(0.001)
+            yield n, object()
+
+    def process_pages(imgs, page_nos, *args):
+        chunks.append(len(page_nos))
+        time.sleep(0.005)
+        return [{"page_no": n, "bill_items": []} for n in page_nos]
+
+    monkeypatch.setattr(pipeline, "iter_pdf_pages", iter_pdf_pages)
+    monkeypatch.setattr(pipeline, "process_pages", process_pages)
+    yield chunks
+    executor.shutdown()
+
+
+def test_concurrent_documents_with_partial_chunks_finish(stub_pipeline):
+    async def run():
+        docs = [pipeline.extract_document(f"doc{i}.pdf") for i in range(4)]
+        return await asyncio.wait_for(asyncio.gather(*docs), timeout=10)
+
+    results = asyncio.run(run())
+    assert [[int(p["page_no"]) for p in pages] for pages in results] == [list(range(1, PAGES + 1))] * 4
+    assert pipeline._page_slots._value == 4
+
+
+def test_single_document_still_fills_chunks(stub_pipeline):
+    pages = asyncio.run(asyncio.wait_for(pipeline.extract_document("doc.pdf"), timeout=10))
+    assert len(pages) == PAGES
+    assert stub_pipeline == [4, 4, 2]
+
+
+def test_shared_memory_copy_runs_off_the_event_loop(stub_pipeline, monkeypatch):
+    threads = []
+    monkeypatch.setattr(pipeline, "PAGE_HANDOFF", "shm")
+    monkeypatch.setattr(pipeline, "share_page", lambda img: threads.append(threading.current_thread()) or img)
+
+    async def run():
+        return threading.current_thread(), await pipeline.extract_document("doc.pdf")
+
+    loop_thread, pages = asyncio.run(run())
+    assert len(pages) == PAGES
+    assert len(threads) == PAGES and loop_thread not in threads
+
+
+def test_page_handoff_mode_is_part_of_the_cache_key(monkeypatch):
+    monkeypatch.setattr(pipeline, "PAGE_HANDOFF", "shm")
+    shm = pipeline._extraction_params(40)
+    monkeypatch.setattr(pipeline, "PAGE_HANDOFF", "pickle")
+    assert pipeline._extraction_params(40) != shm
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from src.preprocess import deskew_and_binarize, estimate_skew, ink_mask, pil_to_gray
+
+
+def _text_page(w=1200, h=1600):
+    # rows of word-like bars, as on a bill, in mid gray on off-white paper
+    img = Image.new("L", (w, h), 235)
+    d = ImageDraw.Draw(img)
+    for y in range(150, h - 150, 40):
+        x = 100
+        for width in (120, 60, 200, 90, 150):
+            d.rectangle((x, y, x + width, y + 14), fill=40)
+            x += width + 30
+    return img
+
+
+def _skew(img):
+    mask, _ = ink_mask(pil_to_gray(img), max_width=800)
+    return estimate_skew(mask)
+
+
+@pytest.mark.parametrize("angle", [-3.0, -1.2, 2.5, 4.0])
+def test_projection_profile_recovers_a_known_rotation(angle):
+    rotated = _text_page().rotate(angle, fillcolor=235, resample=Image.BILINEAR)
+    # the estimate is the correcting rotation
+    assert _skew(rotated) == pytest.approx(-angle, abs=0.2)
+
+
+def test_deskew_straightens_and_binarizes():
+    out = deskew_and_binarize(_text_page().rotate(3.0, fillcolor=235, resample=Image.BILINEAR))
+    assert out.mode == "L"
+    assert set(np.unique(np.asarray(out))) <= {0, 255}
+    assert abs(_skew(out)) <= 0.2
+
+
+def test_small_skew_and_blank_pages_are_only_binarized():
+    page = _text_page().rotate(0.2, fillcolor=235, resample=Image.BILINEAR)
+    out = deskew_and_binarize(page, min_angle=0.5)
+    _, expected = cv2.threshold(np.asarray(page), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    assert np.array_equal(np.asarray(out), expected)
+
+    blank = deskew_and_binarize(Image.new("RGB", (300, 200), "white"))
+    assert blank.size == (300, 200) and blank.mode == "L"
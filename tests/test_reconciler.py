@@ -0,0 +1,61 @@
+from src.reconciler import Reconciler, find_printed_total_in_lines, reconcile_totals
+from src.records import BillItem, Line
+
+
+def _lines(*texts):
+    return [Line(t, 90, 0, 0) for t in texts]
+
+
+def test_printed_total_keeps_thousands_separators():
+    assert find_printed_total_in_lines(_lines("Grand Total 21,800.00")) == 21800.0
+    assert find_printed_total_in_lines(_lines("Total 1,234.50")) == 1234.5
+    assert find_printed_total_in_lines(_lines("Total Amount: 560")) == 560.0
+
+
+def test_grouped_printed_total_matches_items():
+    page = {
+        "page_no": "1",
+        "bill_items": [BillItem("Room rent", 1.0, 20000.0, 20000.0), BillItem("Pharmacy", 1.0, 1800.0, 1800.0)],
+        "ocr_lines": _lines("Room rent 20,000.00", "Pharmacy 1,800.00", "Grand Total 21,800.00"),
+    }
+    result = reconcile_totals([page])
+    assert result["printed_total"] == 21800.0
+    assert "note" not in result
+
+
+def test_subtotal_and_carry_forward_rows_are_not_printed_totals():
+    lines = _lines("Total 500.00", "Sub Total 120.00", "Page Total 80.00", "Balance carried forward 80.00")
+    assert find_printed_total_in_lines(lines) == 500.0
+
+
+def _page(page_no, items, *texts):
+    return {"page_no": str(page_no), "bill_items": [BillItem(n, 1.0, a, a) for n, a in items], "ocr_lines": _lines(*texts)}
+
+
+def test_reconciler_is_independent_of_page_order():
+    pages = [
+        _page(1, [("Room rent", 2000.0), ("Pharmacy", 450.0)], "City Hospital", "Room rent 2,000.00"),
+        _page(2, [("Pharmacy", 450.0), ("Balance carried forward", 2450.0), ("Lab", 300.0)],
+              "City Hospital", "Total 2,750.00"),
+    ]
+    forward = Reconciler()
+    backward = Reconciler()
+    for page in pages:
+        forward.add_page(page)
+    for page in reversed(pages):
+        backward.add_page(page)
+    assert forward.result() == backward.result() == {"reconciled_amount": 2750.0, "printed_total": 2750.0}
+    assert sorted(it.item_name for it in forward.items()) == ["Lab", "Pharmacy", "Room rent"]
+    assert forward.running_totals()["unique_item_count"] == 3
+
+
+def test_total_row_repeated_as_a_page_header_is_ignored():
+    pages = [
+        _page(1, [("Room rent", 2000.0)], "Total Amount 9,999.00", "Room rent 2,000.00"),
+        _page(2, [("Lab", 300.0)], "Total Amount 9,999.00", "Lab 300.00", "Net Total 2,300.00"),
+        _page(3, [], "Total Amount 9,999.00", "Thank you"),
+    ]
+    assert Reconciler().printed_total() is None
+    result = reconcile_totals(pages)
+    assert result["printed_total"] == 2300.0
+    assert "note" not in result
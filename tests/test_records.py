@@ -0,0 +1,42 @@
+import orjson
+
+from src.records import BillItem, Line, Word, bill_to_dict, page_to_dict
+
+
+def _page():
+    line = Line("Room rent 1,200.00", 91, 100, 900, [Word("Room", 100, 180, 40, 91)])
+    return {
+        "page_no": "1",
+        "page_type": "Bill Detail",
+        "bill_items": [BillItem("Room rent", 1.0, 1200.0, 1200.0, 91)],
+        "lines": [line],
+        "ocr_lines": [line],
+    }
+
+
+def test_ocr_lines_are_dropped_unless_asked_for():
+    slim = page_to_dict(_page())
+    assert set(slim) == {"page_no", "page_type", "bill_items"}
+    assert slim["bill_items"][0]["item_amount"] == 1200.0
+
+    full = page_to_dict(_page(), include_lines=True)
+    assert "ocr_lines" not in full
+    assert full["lines"] == [{"text": "Room rent 1,200.00", "avg_conf": 91, "min_left": 100, "max_right": 900,
+                              "words": [{"text": "Room", "left": 100, "right": 180, "top": 40, "conf": 91}]}]
+
+
+def test_item_fields_limit_keys_and_ignore_unknown_names():
+    page = page_to_dict(_page(), item_fields=["item_amount", "no_such_field", "item_name"])
+    assert page["bill_items"] == [{"item_amount": 1200.0, "item_name": "Room rent"}]
+    assert page_to_dict(_page(), item_fields=["no_such_field"])["bill_items"] == [{}]
+
+
+def test_bill_projection_applies_to_every_page_and_serializes():
+    data = {"pagewise_line_items": [_page(), _page()], "total_item_count": 2, "reconciled_amount": 2400.0}
+    out = bill_to_dict(data, item_fields=["item_name"])
+    assert [p["bill_items"] for p in out["pagewise_line_items"]] == [[{"item_name": "Room rent"}]] * 2
+    assert all("lines" not in p for p in out["pagewise_line_items"])
+    assert out["total_item_count"] == 2
+    # the records themselves are left intact for other consumers
+    assert "lines" in data["pagewise_line_items"][0]
+    assert orjson.loads(orjson.dumps(out)) == out
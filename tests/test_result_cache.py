@@ -0,0 +1,84 @@
+import asyncio
+
+from src import result_cache
+from src.result_cache import COALESCED, HIT, MISS, ResultCache
+
+
+def test_concurrent_requests_share_one_computation():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"total": 1}
+
+    async def main():
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+        return results, await cache.get_or_compute("k", compute)
+
+    results, again = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(status for _, status in results) == [COALESCED] * 4 + [MISS]
+    assert all(value is results[0][0] for value, _ in results)
+    assert again == ({"total": 1}, HIT)
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    cache = ResultCache()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("bad pdf")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(main()))
+    assert cache.get("k") is None
+
+    async def ok():
+        return 1
+
+    assert asyncio.run(cache.get_or_compute("k", ok)) == (1, MISS)
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    cache = ResultCache(max_entries=2, ttl=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_waiter_takes_over_when_the_leader_is_cancelled():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(cache.get_or_compute("k", compute)) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        return leader.cancelled(), results
+
+    cancelled, results = asyncio.run(main())
+    assert cancelled
+    assert len(calls) == 2
+    assert sorted(results) == [(2, COALESCED), (2, COALESCED), (2, MISS)]
+    assert cache.get("k") == 2
@@ -0,0 +1,79 @@
+from PIL import Image, ImageDraw
+
+from src import table_detector
+from src.table_detector import ROI_FOOTER_SCALE, detect_table_region, run_table_region_ocr
+
+W, H = 1240, 1754
+TABLE_TOP, TABLE_BOTTOM = 500, 1200
+
+
+def _page(ruled=True):
+    """
+    Synthetic bill: a header block, an item table (optionally ruled) and a footer.
+    Text lines are drawn as dark bars.
+    """
+    img = Image.new("RGB", (W, H), "white")
+    d = ImageDraw.Draw(img)
+    for y in (80, 110, 140):
+        d.rectangle((100, y, 450, y + 14), fill="black")
+    for y in range(TABLE_TOP + 20, TABLE_BOTTOM - 20, 30):
+        d.rectangle((100, y, 500, y + 14), fill="black")
+        d.rectangle((900, y, 1100, y + 14), fill="black")
+    if ruled:
+        for y in (TABLE_TOP, TABLE_TOP + 10, TABLE_BOTTOM):
+            d.rectangle((80, y, 1160, y + 2), fill="black")
+    for y in (1500, 1530):
+        d.rectangle((700, y, 1100, y + 14), fill="black")
+    return img
+
+
+def _close(a, b, slack=30):
+    return abs(a - b) <= slack
+
+
+def test_ruled_table_is_detected():
+    top, bottom = detect_table_region(_page(ruled=True))
+    assert _close(top, TABLE_TOP) and _close(bottom, TABLE_BOTTOM)
+
+
+def test_unruled_table_is_found_from_the_whitespace_profile():
+    top, bottom = detect_table_region(_page(ruled=False))
+    assert _close(top, TABLE_TOP + 20) and _close(bottom, TABLE_BOTTOM - 20)
+
+
+def test_no_table_on_a_blank_or_tiny_page():
+    assert detect_table_region(Image.new("RGB", (W, H), "white")) is None
+    img = Image.new("RGB", (W, H), "white")
+    ImageDraw.Draw(img).rectangle((100, 100, 600, 114), fill="black")
+    assert detect_table_region(img) is None
+
+
+def _fake_ocr(monkeypatch):
+    calls = []
+
+    def run_ocr_on_image(image, config="", dpi=None):
+        calls.append((image.size, dpi))
+        return {"text": ["word"], "conf": [90], "left": [10], "top": [20], "width": [30], "height": [8]}
+
+    monkeypatch.setattr(table_detector, "run_ocr_on_image", run_ocr_on_image)
+    return calls
+
+
+def test_table_and_footer_ocr_map_back_to_page_coordinates(monkeypatch):
+    calls = _fake_ocr(monkeypatch)
+    top, bottom = detect_table_region(_page())
+    out = run_table_region_ocr(_page(), dpi=300)
+
+    footer_size = (int(W * ROI_FOOTER_SCALE), int((H - bottom) * ROI_FOOTER_SCALE))
+    assert calls == [((W, bottom - top), 300), (footer_size, int(300 * ROI_FOOTER_SCALE))]
+    assert out["top"] == [20 + top, int(round(20 / ROI_FOOTER_SCALE)) + bottom]
+    assert out["left"] == [10, int(round(10 / ROI_FOOTER_SCALE))]
+    assert out["width"] == [30, int(round(30 / ROI_FOOTER_SCALE))]
+
+
+def test_whole_page_ocr_when_no_table_is_found(monkeypatch):
+    calls = _fake_ocr(monkeypatch)
+    blank = Image.new("RGB", (W, H), "white")
+    out = run_table_region_ocr(blank, dpi=200)
+    assert calls == [((W, H), 200)]
+    assert out["top"] == [20]
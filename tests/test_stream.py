@@ -0,0 +1,49 @@
+import orjson
+from fastapi.testclient import TestClient
+
+import app as api
+from src.records import BillItem
+
+
+def _records(response):
+    return [orjson.loads(line) for line in response.iter_lines() if line]
+
+
+def test_stream_emits_pages_then_the_summary(monkeypatch):
+    page = {"page_no": "2", "bill_items": [BillItem("Room rent", 1.0, 1200.0, 1200.0)]}
+    running = {"reconciled_amount": 1200.0, "unique_item_count": 1, "pages_reconciled": 1}
+    seen = []
+
+    async def iter_bill(document, include_lines=False):
+        seen.append((document, include_lines))
+        yield page, running
+        yield None, {"pagewise_line_items": [page], "total_item_count": 1, "reconciled_amount": 1200.0}
+
+    monkeypatch.setattr(api, "iter_bill", iter_bill)
+    response = TestClient(api.app).post("/extract-bill-data/stream",
+                                        json={"document": "bill.pdf", "fields": ["item_name", "item_amount"]})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = _records(response)
+    assert seen == [("bill.pdf", False)]
+    assert [r["type"] for r in records] == ["page", "summary"]
+    assert records[0]["page"]["page_no"] == "2"
+    assert records[0]["page"]["bill_items"] == [{"item_name": "Room rent", "item_amount": 1200.0}]
+    assert records[0]["running_totals"] == running
+    summary = records[1]
+    assert summary["is_success"] and summary["total_item_count"] == 1 and summary["reconciled_amount"] == 1200.0
+    assert "pagewise_line_items" not in summary and "token_usage" in summary
+
+
+def test_stream_failure_ends_with_an_error_record(monkeypatch):
+    page = {"page_no": "1", "bill_items": []}
+
+    async def iter_bill(document, include_lines=False):
+        yield page, {"reconciled_amount": 0.0, "unique_item_count": 0, "pages_reconciled": 1}
+        raise RuntimeError("page 2 failed")
+
+    monkeypatch.setattr(api, "iter_bill", iter_bill)
+    response = TestClient(api.app).post("/extract-bill-data/stream", json={"document": "bill.pdf"})
+    records = _records(response)
+    assert [r["type"] for r in records] == ["page", "error"]
+    assert records[1] == {"type": "error", "is_success": False, "error": "page 2 failed"}
@@ -0,0 +1,78 @@
+import random
+
+from src.table_detector import extract_row_arrays, extract_rows_from_ocr
+
+
+def _reference_rows(ocr, min_confidence=40):
+    # the original dict-per-word grouping that extract_row_arrays replaced
+    n = len(ocr.get("text", []))
+    words = []
+    for i in range(n):
+        txt = str(ocr["text"][i]).strip()
+        if not txt:
+            continue
+        try:
+            conf = int(float(ocr["conf"][i]))
+        except (TypeError, ValueError):
+            conf = -1
+        if 0 <= conf < min_confidence:
+            continue
+        left = int(ocr["left"][i])
+        words.append({"text": txt, "left": left, "right": left + int(ocr["width"][i]),
+                      "top": int(ocr["top"][i]), "conf": conf})
+    if not words:
+        return []
+    words = sorted(words, key=lambda w: (w["top"], w["left"]))
+    lines = []
+    current = {"top": words[0]["top"], "words": [words[0]]}
+    for w in words[1:]:
+        if abs(w["top"] - current["top"]) <= 10:
+            current["words"].append(w)
+        else:
+            lines.append(current)
+            current = {"top": w["top"], "words": [w]}
+    lines.append(current)
+    out = []
+    for line in lines:
+        ws = sorted(line["words"], key=lambda x: x["left"])
+        confs = [w["conf"] for w in ws if w["conf"] >= 0]
+        out.append((
+            " ".join(w["text"] for w in ws),
+            int(sum(confs) / len(confs)) if confs else -1,
+            min(w["left"] for w in ws),
+            max(w["right"] for w in ws),
+            [(w["text"], w["left"], w["right"], w["top"], w["conf"]) for w in ws],
+        ))
+    return out
+
+
+def _random_ocr(rng, n):
+    return {
+        "text": [rng.choice(["", " ", "Room", "rent", "1,200.00", "2", "x", "Total"]) for _ in range(n)],
+        "conf": [rng.choice([-1, "-1", 10, 39, 40, 95.0, "87"]) for _ in range(n)],
+        "left": [rng.randrange(0, 2000, 7) for _ in range(n)],
+        "top": [rng.randrange(0, 300, 3) for _ in range(n)],
+        "width": [rng.randrange(5, 120) for _ in range(n)],
+    }
+
+
+def test_row_grouping_matches_the_reference_on_random_pages():
+    rng = random.Random(8)
+    for _ in range(300):
+        ocr = _random_ocr(rng, rng.randrange(0, 60))
+        got = [
+            (ln.text, ln.avg_conf, ln.min_left, ln.max_right,
+             [(w.text, w.left, w.right, w.top, w.conf) for w in ln.words])
+            for ln in extract_rows_from_ocr(ocr)
+        ]
+        assert got == _reference_rows(ocr)
+
+
+def test_row_arrays_bounds_cover_every_kept_word():
+    ocr = {"text": ["b", "a", "", "c"], "conf": [90, 90, 90, 5],
+           "left": [50, 10, 0, 0], "top": [100, 104, 0, 200], "width": [10, 10, 10, 10]}
+    texts, conf, left, right, top, bounds = extract_row_arrays(ocr)
+    assert texts == ["a", "b"]
+    assert right == [20, 60]
+    assert bounds == [(0, 2)]
+    assert extract_row_arrays({"text": []}) == ([], [], [], [], [], [])
@@ -0,0 +1,84 @@
+import subprocess
+
+from src import ocr, pipeline
+from src.ocr import extract_pdf_text_layer
+
+_XHTML = """<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title></title></head>
+<body>
+<doc>
+  <page width="595.000000" height="842.000000">
+    <word xMin="72.000000" yMin="100.000000" xMax="120.000000" yMax="112.000000">Room</word>
+    <word xMin="124.000000" yMin="100.000000" xMax="150.000000" yMax="112.000000">rent</word>
+    <word xMin="400.000000" yMin="100.500000" xMax="450.000000" yMax="112.000000">1,200.00</word>
+    <word xMin="72.000000" yMin="130.000000" xMax="140.000000" yMax="142.000000">X-ray &amp; scan</word>
+  </page>
+  <page width="595.000000" height="842.000000">
+    <word xMin="72.000000" yMin="800.000000" xMax="100.000000" yMax="810.000000">Page</word>
+  </page>
+</doc>
+</body>
+</html>
+"""
+
+
+def _pdftotext(monkeypatch, stdout, returncode=0):
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, returncode, stdout=stdout.encode(), stderr=b"")
+
+    monkeypatch.setattr(ocr.subprocess, "run", run)
+    return calls
+
+
+def test_text_layer_words_become_an_ocr_dict_at_the_page_dpi(monkeypatch):
+    calls = _pdftotext(monkeypatch, _XHTML)
+    pages = extract_pdf_text_layer("bill.pdf", dpi=144, min_words=2)
+    assert calls[0][1:] == ["-bbox", "bill.pdf", "-"]
+    # the one-word page is too sparse and is left for OCR
+    assert list(pages) == [1]
+    page = pages[1]
+    assert page["text"] == ["Room", "rent", "1,200.00", "X-ray & scan"]
+    assert page["left"] == [144, 248, 800, 144]
+    assert page["top"] == [200, 200, 201, 260]
+    assert page["width"] == [96, 52, 100, 136]
+    assert page["height"] == [24, 24, 23, 24]
+    assert page["conf"] == [100] * 4
+    assert set(page["page_num"]) == {1}
+
+
+def test_text_layer_failures_mean_every_page_is_ocrd(monkeypatch):
+    _pdftotext(monkeypatch, "", returncode=1)
+    assert extract_pdf_text_layer("scan.pdf") == {}
+
+    def missing(args, **kwargs):
+        raise FileNotFoundError(args[0])
+
+    monkeypatch.setattr(ocr.subprocess, "run", missing)
+    assert extract_pdf_text_layer("scan.pdf") == {}
+
+
+def test_pages_without_a_text_layer_fall_back_to_ocr(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pipeline, "TEXT_LAYER_ENABLED", True)
+    monkeypatch.setattr(pipeline, "ADAPTIVE_DPI", False)
+    monkeypatch.setattr(pipeline, "ROI_OCR", True)
+    monkeypatch.setattr(pipeline, "pdf_page_count", lambda path: 3)
+    monkeypatch.setattr(pipeline, "iter_pdf_pages",
+                        lambda path, pages, dpi=300: ((n, f"image {n}") for n in pages))
+    monkeypatch.setattr(pipeline, "process_page",
+                        lambda img, page_no, conf, dpi, pdf_path, ocr, include_lines:
+                        calls.append((page_no, img, ocr)) or {"page_no": page_no})
+
+    # page 2 has a usable text layer (after min_words filtering); 1 and 3 are scans
+    monkeypatch.setattr(pipeline, "extract_pdf_text_layer", lambda path, dpi: {2: {"text": ["Room"]}})
+    pipeline.extract_document_sync("doc.pdf")
+    assert calls == [("1", "image 1", None), ("2", None, {"text": ["Room"]}), ("3", "image 3", None)]
+
+    calls.clear()
+    monkeypatch.setattr(pipeline, "extract_pdf_text_layer", lambda path, dpi: {})
+    pipeline.extract_document_sync("doc.pdf")
+    assert [(page_no, img) for page_no, img, _ in calls] == [("1", "image 1"), ("2", "image 2"), ("3", "image 3")]